@@ -0,0 +1,76 @@
+"""
+Compare the HTML extraction backends over a corpus of saved pages.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_extract path/to/pages [--repeat 5]
+
+Every *.html / *.htm file under the directory is parsed by each backend.
+Reports pages/sec, mean/p50/p99 per-page time and how many pages produced
+identical text in every backend.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from services.extract import BACKENDS
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def load_corpus(directory: Path) -> Dict[str, str]:
+    pages = {}
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() in (".html", ".htm") and path.is_file():
+            pages[str(path)] = path.read_text(encoding="utf-8", errors="replace")
+    return pages
+
+
+def run(pages: Dict[str, str], repeat: int):
+    outputs: Dict[str, Dict[str, str]] = {}
+    total_bytes = sum(len(html) for html in pages.values())
+    print(f"{len(pages)} pages, {total_bytes / 1024:.0f} KiB, {repeat} rounds\n")
+    print(f"{'backend':<8} {'pages/s':>9} {'mean ms':>9} {'p50 ms':>9} {'p99 ms':>9}")
+
+    for name, backend in BACKENDS.items():
+        timings = []
+        outputs[name] = {}
+        for _ in range(repeat):
+            for path, html in pages.items():
+                start = time.perf_counter()
+                outputs[name][path] = backend(html)
+                timings.append(time.perf_counter() - start)
+        print(
+            f"{name:<8} {len(timings) / sum(timings):>9.1f} "
+            f"{statistics.mean(timings) * 1000:>9.2f} "
+            f"{percentile(timings, 50) * 1000:>9.2f} "
+            f"{percentile(timings, 99) * 1000:>9.2f}"
+        )
+
+    names = list(outputs)
+    mismatched = [path for path in pages if len({outputs[name][path] for name in names}) > 1]
+    print(f"\nidentical text: {len(pages) - len(mismatched)}/{len(pages)} pages")
+    for path in mismatched:
+        print(f"  differs: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", type=Path, help="directory of saved HTML pages")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds over the corpus per backend")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        sys.exit(f"No .html files found under {args.corpus}")
+    run(pages, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
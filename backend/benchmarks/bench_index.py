@@ -0,0 +1,145 @@
+"""
+Build and query the local passage index over a synthetic corpus.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_index [--passages 1000000] [--queries 1000]
+
+Passages are drawn from a Zipf-distributed vocabulary, so posting list lengths look like
+those of real text. The head of the distribution is left out, as the tokenizer drops stop
+words; the commonest remaining words still occur in about one passage in six.
+
+Reports indexing throughput, segments and disk size, the time to reopen the index from
+disk, query latency (p50/p95/p99) for one to four term queries, and the process's
+resident memory.
+"""
+import argparse
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+
+from services.passage_index import PassageIndex
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def rss() -> str:
+    """
+    Resident memory, split into process memory and memory-mapped index files (shared page cache)
+    """
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            fields[key] = int(value.split()[0]) / 1024 if value.strip().endswith("kB") else 0
+    return f"{fields.get('RssAnon', 0):,.0f} MiB process + {fields.get('RssFile', 0):,.0f} MiB mapped files"
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> np.ndarray:
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    words = {"".join(rng.choice(letters, rng.integers(4, 10))) for _ in range(size * 2)}
+    return np.array(sorted(words)[:size])
+
+
+# Most frequent word ranks left out of the corpus, standing in for stop words
+STOPWORD_RANKS = 50
+
+
+def zipf_words(rng: np.random.Generator, vocab: np.ndarray, size) -> np.ndarray:
+    weights = 1.0 / (np.arange(1, len(vocab) + 1) + STOPWORD_RANKS)
+    return vocab[rng.choice(len(vocab), size, p=weights / weights.sum())]
+
+
+def passages(count: int, words: int, vocab: np.ndarray, rng: np.random.Generator, batch: int = 1000):
+    """
+    Batches of (source, text) passages, `words` Zipf-distributed words each, ten passages per source
+    """
+    for start in range(0, count, batch):
+        size = min(batch, count - start)
+        rows = zipf_words(rng, vocab, size * words).reshape(size, words)
+        yield [(f"https://example.com/{(start + row) // 10}", " ".join(rows[row]) + ".") for row in range(size)]
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    vocab = vocabulary(args.vocab, rng)
+    directory = args.dir or tempfile.mkdtemp(prefix="bench-index-")
+    print(f"{args.passages} passages of {args.words} words, vocabulary {len(vocab)}, index in {directory}\n")
+
+    index = PassageIndex(directory, flush_passages=args.flush_passages, merge_factor=args.merge_factor)
+    started = time.perf_counter()
+    added = 0
+    for batch in passages(args.passages, args.words, vocab, rng):
+        added += index.add_passages(batch)
+    index.flush()
+    build = time.perf_counter() - started
+    stats = index.snapshot()
+    index.close()
+    print(f"indexed       {added} passages in {build:.1f}s ({added / build:,.0f} passages/s)")
+    print(f"segments      {stats['segments']} after {stats['flushes']} flushes and {stats['merges']} merges")
+    print(f"postings      {stats['postings']:,}")
+    print(f"disk          {stats['disk_bytes'] / 1024 / 1024:,.0f} MiB")
+    print(f"rss (build)   {rss()}, peak {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MiB in all")
+
+    # A fresh process-like view: segments are opened memory-mapped from disk
+    started = time.perf_counter()
+    index = PassageIndex(directory)
+    index.search("warmup", 1)
+    print(f"reopen        {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    # Query terms from the frequent head to the rare tail of the vocabulary
+    queries = zipf_words(rng, vocab, (args.queries, 4))
+    timings = {terms: [] for terms in range(1, 5)}
+    found = 0
+    for query_words in queries:
+        terms = int(rng.integers(1, 5))
+        query = " ".join(query_words[:terms])
+        start = time.perf_counter()
+        hits = index.search(query, args.k)
+        timings[terms].append(time.perf_counter() - start)
+        found += bool(hits)
+
+    print(f"\n{'terms':<6} {'queries':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for terms, values in timings.items():
+        if values:
+            print(
+                f"{terms:<6} {len(values):>8} {statistics.mean(values) * 1000:>9.2f} "
+                f"{percentile(values, 50) * 1000:>9.2f} {percentile(values, 95) * 1000:>9.2f} "
+                f"{percentile(values, 99) * 1000:>9.2f}"
+            )
+    every = [value for values in timings.values() for value in values]
+    print(f"{'all':<6} {len(every):>8} {statistics.mean(every) * 1000:>9.2f} {percentile(every, 50) * 1000:>9.2f} "
+          f"{percentile(every, 95) * 1000:>9.2f} {percentile(every, 99) * 1000:>9.2f}")
+    print(f"\nqueries with results: {found}/{len(every)}")
+    print(f"rss (queried) {rss()}")
+    index.close()
+
+    if not args.dir and not args.keep:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--passages", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=80, help="words per passage")
+    parser.add_argument("--vocab", type=int, default=200_000, help="distinct words in the corpus")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10, help="passages returned per query")
+    parser.add_argument("--flush-passages", type=int, default=20_000, help="passages per new segment")
+    parser.add_argument("--merge-factor", type=int, default=8)
+    parser.add_argument("--dir", help="index directory to build in (kept afterwards); default is a temporary one")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary index directory")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
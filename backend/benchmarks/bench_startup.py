@@ -0,0 +1,241 @@
+"""
+Cold start of the app: import time per module, time to the first successful request and
+memory per worker, for each startup mode.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup [--modes lazy,prewarm,eager,workers,preload]
+                                       [--workers 2] [--runs 3]
+
+Import times come from `python -X importtime -c "import main"`: the app's imports and
+theirs, by cumulative time, followed by the modules that STARTUP_MODE defers until first
+use (see services/startup.py).
+
+Each mode then starts the server in a subprocess with fresh cache directories:
+
+- lazy, prewarm, eager: one uvicorn process with that STARTUP_MODE
+- workers: `uvicorn --workers N`, each worker a fresh interpreter
+- preload: `python serve.py --workers N`, workers forked after the libraries are loaded
+
+Reported per mode (median over runs): time from launch to the first successful response,
+the latency of the first requests that need deferred modules (an OAuth login redirect and
+a passage index query) sent right after that, and when the background prewarm finished.
+Memory is read once startup has settled, from /proc: RSS and PSS per worker (PSS splits
+shared pages between the processes sharing them) and the PSS of all workers together.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.stubs import free_port
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def app_env(workdir: str, **extra: str) -> Dict[str, str]:
+    return {
+        **os.environ,
+        "SESSION_DB": os.path.join(workdir, "sessions.sqlite3"),
+        "PAGE_CACHE_DIR": os.path.join(workdir, "pages"),
+        "JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+        "PASSAGE_INDEX_DIR": os.path.join(workdir, "index"),
+        "GMAIL_CLIENT_ID": "bench-client",
+        "GMAIL_CLIENT_SECRET": "bench-secret",
+        "PYTHONUNBUFFERED": "1",
+        **extra,
+    }
+
+
+def import_times(env: Dict[str, str]) -> Tuple[List[Tuple[int, str, float]], Dict[str, float]]:
+    """
+    (depth, module, cumulative ms) for every module `import main` loads, and the time
+    each deferred module then takes to load
+    """
+    script = "import json, main; from services import startup; startup.preload(); print(json.dumps(startup.stats))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=BACKEND_DIR, env={**env, "PYTHONPATH": str(BACKEND_DIR)}, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    main_done = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if not main_done:
+            rows.append((depth, name.strip(), int(cumulative) / 1000))
+        # Modules are listed after their imports, so main comes last of its tree
+        main_done = main_done or (depth == 0 and name.strip() == "main")
+    return rows, json.loads(result.stdout.splitlines()[-1])["modules"]
+
+
+def print_import_times(rows: List[Tuple[int, str, float]], deferred: Dict[str, float], depth: int, min_ms: float):
+    total = next(ms for level, name, ms in rows if level == 0 and name == "main")
+    print(f"import main: {total:,.0f} ms\n")
+    print(f"{'module':<52} {'cumulative ms':>14}")
+    # Rows come children first; print each level above its imports, largest first
+    tree: Dict[Optional[int], List[Tuple[int, int]]] = {}
+    stack: List[Tuple[int, int]] = []
+    for index, (level, _, _) in enumerate(rows):
+        children = []
+        while stack and stack[-1][0] > level:
+            children.append(stack.pop()[1])
+        tree[index] = children
+        stack.append((level, index))
+
+    def show(index: int):
+        level, name, ms = rows[index]
+        if level > depth or ms < min_ms:
+            return
+        print(f"{'  ' * level + name:<52} {ms:>14,.1f}")
+        for child in sorted(tree[index], key=lambda child: -rows[child][2]):
+            show(child)
+
+    show(len(rows) - 1)
+    print(f"\n{'deferred module (loaded on first use)':<52} {'ms':>14}")
+    for name, ms in deferred.items():
+        print(f"{name:<52} {ms:>14,.1f}")
+
+
+def proc_kb(pid: int, path: str, fields: Tuple[str, ...]) -> Dict[str, int]:
+    values = {}
+    try:
+        with open(f"/proc/{pid}/{path}") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in fields:
+                    values[key] = int(value.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def worker_pids(pid: int) -> List[int]:
+    """
+    The server's worker processes: its children other than multiprocessing helpers, or itself
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline") as f:
+                cmdline = f.read()
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid and "resource_tracker" not in cmdline:
+            children.append(int(entry))
+    return children or [pid]
+
+
+def command(mode: str, port: int, workers: int) -> Tuple[List[str], Dict[str, str]]:
+    if mode == "preload":
+        return [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers), "--log-level", "warning"], {}
+    args = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log"]
+    if mode == "workers":
+        return args + ["--workers", str(workers)], {}
+    return args, {"STARTUP_MODE": mode}
+
+
+def start_once(mode: str, workers: int, settle: float, measure_memory: bool) -> Dict[str, float]:
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    args, extra = command(mode, port, workers)
+    started = time.perf_counter()
+    process = subprocess.Popen(args, cwd=BACKEND_DIR, env=app_env(workdir, **extra), stdout=subprocess.DEVNULL)
+    result: Dict[str, float] = {}
+    try:
+        with httpx.Client(timeout=30) as client:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"The app exited during startup ({mode})")
+                try:
+                    if client.get(f"{url}/api/startup/stats").status_code == 200:
+                        break
+                except httpx.HTTPError:
+                    time.sleep(0.005)
+                if time.perf_counter() - started > 60:
+                    raise RuntimeError(f"The app did not start within 60 seconds ({mode})")
+            result["ready_ms"] = (time.perf_counter() - started) * 1000
+
+            # First requests that need modules loaded on first use
+            start = time.perf_counter()
+            if client.get(f"{url}/api/auth/login").status_code >= 400:
+                raise RuntimeError("The login route failed")
+            result["first_login_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            client.post(f"{url}/api/index/query", json={"query": "startup benchmark"}).raise_for_status()
+            result["first_query_ms"] = (time.perf_counter() - start) * 1000
+
+            deadline = time.perf_counter() + 30
+            while time.perf_counter() < deadline:
+                stats = client.get(f"{url}/api/startup/stats").json()
+                if stats["done"]:
+                    break
+                time.sleep(0.01)
+            if mode == "prewarm":
+                result["prewarm_ms"] = stats["elapsed_ms"]
+
+        if measure_memory:
+            time.sleep(settle)
+            pids = worker_pids(process.pid)
+            memory = [proc_kb(pid, "smaps_rollup", ("Rss", "Pss")) for pid in pids]
+            result["workers"] = len(pids)
+            result["rss_mb"] = statistics.mean(m.get("Rss", 0) for m in memory) / 1024
+            result["pss_mb"] = statistics.mean(m.get("Pss", 0) for m in memory) / 1024
+            result["total_pss_mb"] = sum(m.get("Pss", 0) for m in memory) / 1024
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def run(args):
+    env = app_env(tempfile.mkdtemp(prefix="bench-startup-"))
+    rows, deferred = import_times(env)
+    print_import_times(rows, deferred, args.depth, args.min_ms)
+
+    print(f"\n{'mode':<9} {'ready ms':>9} {'1st login ms':>13} {'1st query ms':>13} {'prewarm ms':>11} "
+          f"{'workers':>8} {'RSS/worker':>11} {'PSS/worker':>11} {'PSS total':>10}")
+    for mode in args.modes.split(","):
+        runs = [start_once(mode, args.workers, args.settle, measure_memory=attempt == args.runs - 1) for attempt in range(args.runs)]
+
+        def median(key: str) -> str:
+            values = [result[key] for result in runs if key in result]
+            return f"{statistics.median(values):,.0f}" if values else "-"
+
+        memory = runs[-1]
+        print(f"{mode:<9} {median('ready_ms'):>9} {median('first_login_ms'):>13} {median('first_query_ms'):>13} "
+              f"{median('prewarm_ms'):>11} {memory['workers']:>8} {memory['rss_mb']:>7,.0f} MiB "
+              f"{memory['pss_mb']:>7,.0f} MiB {memory['total_pss_mb']:>6,.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="lazy,prewarm,eager,workers,preload")
+    parser.add_argument("--workers", type=int, default=2, help="workers in the workers and preload modes")
+    parser.add_argument("--runs", type=int, default=3, help="server starts per mode")
+    parser.add_argument("--settle", type=float, default=3.0, help="seconds to wait before reading memory")
+    parser.add_argument("--depth", type=int, default=2, help="import tree levels to show")
+    parser.add_argument("--min-ms", type=float, default=5.0, help="hide imports faster than this")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
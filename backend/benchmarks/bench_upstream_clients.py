@@ -0,0 +1,134 @@
+"""
+Compare a fresh httpx client per request with the pooled upstream clients.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_upstream_clients [--requests 2000] [--concurrency 50] [--tls]
+
+Starts a local stub server and sends the same load through both client
+strategies, reporting requests/sec and p50/p99 latency. With --tls the stub
+serves HTTPS with a throwaway self-signed certificate (needs the openssl CLI),
+which also captures the TLS handshake cost that pooling avoids.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+import uvicorn
+
+from services.upstream import UpstreamConfig
+
+
+async def stub_app(scope, receive, send):
+    """
+    Minimal ASGI app answering every request with a small JSON body
+    """
+    if scope["type"] != "http":
+        return
+    body = b'{"choices": [{"message": {"content": "ok"}}]}'
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def self_signed_cert(directory: str):
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def start_stub(port: int, certfile: Optional[str] = None, keyfile: Optional[str] = None) -> uvicorn.Server:
+    config = uvicorn.Config(
+        stub_app, host="127.0.0.1", port=port, log_level="error",
+        ssl_certfile=certfile, ssl_keyfile=keyfile,
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+async def drive(request: Callable[[], Awaitable[None]], total: int, concurrency: int):
+    latencies: List[float] = []
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - start), latencies
+
+
+async def run(url: str, total: int, concurrency: int, verify: bool):
+    async def per_request():
+        async with httpx.AsyncClient(verify=verify) as client:
+            (await client.get(url)).raise_for_status()
+
+    # Same settings the app uses for its upstreams, sized to the benchmark's concurrency
+    config = UpstreamConfig(name="bench", max_connections=concurrency, max_keepalive_connections=concurrency)
+    pooled_client = httpx.AsyncClient(**config.client_kwargs(), verify=verify)
+
+    async def pooled():
+        (await pooled_client.get(url)).raise_for_status()
+
+    print(f"{total} requests, concurrency {concurrency}, {url}\n")
+    print(f"{'client':<12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, request in (("per-request", per_request), ("pooled", pooled)):
+        # Warm up once so both strategies start from the same state
+        await request()
+        rps, latencies = await drive(request, total, concurrency)
+        print(f"{name:<12} {rps:>9.1f} {percentile(latencies, 50) * 1000:>9.2f} {percentile(latencies, 99) * 1000:>9.2f}")
+    await pooled_client.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tls", action="store_true", help="serve the stub over HTTPS")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = keyfile = None
+        if args.tls:
+            certfile, keyfile = self_signed_cert(directory)
+        server = start_stub(port, certfile, keyfile)
+        scheme = "https" if args.tls else "http"
+        try:
+            asyncio.run(run(f"{scheme}://127.0.0.1:{port}/", args.requests, args.concurrency, verify=not args.tls))
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
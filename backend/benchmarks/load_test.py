@@ -0,0 +1,346 @@
+"""
+Offline load test of the API routes and the full research flow.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test [--requests 200] [--concurrency 20]
+                                   [--scenarios search,scrape,research] [--output results.json]
+                                   [--compare previous.json]
+
+Starts local stand-ins for Google Custom Search, Groq, a site farm and the Gmail API
+(see benchmarks/stubs.py), then runs the app with uvicorn in a subprocess pointed at
+them through the usual *_BASE_URL settings, with fresh caches. Each scenario drives
+concurrent requests against one route. The report gives throughput, p50/p95/p99
+latency, time to first byte for streamed routes, errors, and the app's memory.
+
+Results are written as JSON (by default to benchmarks/results/) tagged with the
+current commit. Pass an earlier file to --compare to print the change per scenario.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import itsdangerous
+
+from benchmarks.stubs import StubServers, StubSettings, free_port
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = BACKEND_DIR / "benchmarks" / "results"
+SESSION_SECRET = "bench-session-secret"
+
+# Text sent to /api/groq: about 2,000 tokens, the size of a few scraped passages
+GROQ_CONTENT = " ".join(["Source: http://example.com/page\nThe measured value rose steadily over the period."] * 110)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def process_rss_kb(pid: int) -> Tuple[int, int]:
+    """
+    Current and peak resident memory of a process, from /proc (Linux only)
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                key, _, value = line.partition(":")
+                fields[key] = value.strip()
+    except OSError:
+        return 0, 0
+
+    def kb(name: str) -> int:
+        return int(fields.get(name, "0 kB").split()[0])
+
+    return kb("VmRSS"), kb("VmHWM")
+
+
+def child_pids(pid: int) -> List[int]:
+    children: List[int] = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as handle:
+                children.extend(int(child) for child in handle.read().split())
+    except OSError:
+        return []
+    return children + [grandchild for child in children for grandchild in child_pids(child)]
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """
+    The app's resident memory, and that of its worker processes (extraction pool, browser)
+    """
+    rss, peak = process_rss_kb(pid)
+    children = sum(process_rss_kb(child)[0] for child in child_pids(pid))
+    return {"rss_mb": round(rss / 1024, 1), "peak_rss_mb": round(peak / 1024, 1), "children_rss_mb": round(children / 1024, 1)}
+
+
+class App:
+    """
+    The API under test, in a uvicorn subprocess with its own cache directories
+    """
+
+    def __init__(self, env: Dict[str, str], workdir: str):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            **env,
+            "SESSION_SECRET_KEY": SESSION_SECRET,
+            "SESSION_DB": os.path.join(workdir, "sessions.sqlite3"),
+            "PAGE_CACHE_DIR": os.path.join(workdir, "pages"),
+            "JOBS_DB": os.path.join(workdir, "jobs.sqlite3"),
+            "PASSAGE_INDEX_DIR": os.path.join(workdir, "index"),
+            "PYTHONUNBUFFERED": "1",
+        }
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                if httpx.get(f"{self.url}/openapi.json", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            if self.process.poll() is not None:
+                raise RuntimeError("The app exited during startup")
+            time.sleep(0.2)
+        raise RuntimeError("The app did not start within 30 seconds")
+
+    def session_cookie(self) -> str:
+        """
+        A logged-in session with Gmail credentials that never need refreshing
+        """
+        sys.path.insert(0, str(BACKEND_DIR))
+        from services.sessions import SessionStore
+
+        credentials = {
+            "token": "bench-token",
+            "refresh_token": "bench-refresh-token",
+            "client_id": "bench-client",
+            "client_secret": "bench-secret",
+            "expiry": "2099-01-01T00:00:00Z",
+        }
+        store = SessionStore(path=self.env["SESSION_DB"])
+        store.set("bench-session", {"credentials": json.dumps(credentials), "email": "bench@example.com"}, 86400)
+        store.close()
+        return itsdangerous.Signer(SESSION_SECRET).sign(b"bench-session").decode()
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+# A scenario builds the i-th request as (method, path, json body, streamed)
+Scenario = Callable[[int, str], Tuple[str, str, Dict[str, Any], bool]]
+
+
+def farm_links(run_id: str, i: int, stubs: StubServers, count: int = 5) -> List[str]:
+    return [f"{stubs.url('sites')}/site/{run_id}-{i}/{page}.html" for page in range(count)]
+
+
+def scenarios(stubs: StubServers) -> Dict[str, Scenario]:
+    return {
+        "search": lambda i, run: ("POST", "/api/search", {"query": f"bench {run} {i}", "num": 5}, False),
+        "scrape": lambda i, run: ("POST", "/api/scrape", {"links": farm_links(run, i, stubs)}, False),
+        "scrape_stream": lambda i, run: ("POST", "/api/scrape/stream", {"links": farm_links(run, i, stubs)}, True),
+        "groq": lambda i, run: ("POST", "/api/groq", {"prompt": f"Summarize {i}", "content": GROQ_CONTENT, "no_cache": True}, False),
+        "groq_stream": lambda i, run: (
+            "POST", "/api/groq/stream", {"prompt": f"Summarize {i}", "content": GROQ_CONTENT, "no_cache": True}, True,
+        ),
+        "email": lambda i, run: (
+            "POST", "/api/email", {"to": [f"user{i}@example.com"], "subject": "Bench", "content": "<p>Hello</p>"}, False,
+        ),
+        "research": lambda i, run: ("POST", "/api/research", {"query": f"research {run} {i}", "no_cache": True}, True),
+    }
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    run_id: str,
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    errors: List[str] = []
+    remaining = iter(range(total))
+
+    async def one(i: int):
+        method, path, body, streamed = scenario(i, run_id)
+        start = time.perf_counter()
+        try:
+            async with client.stream(method, path, json=body) as response:
+                first = None
+                async for _ in response.aiter_raw():
+                    if first is None:
+                        first = time.perf_counter() - start
+                if response.status_code >= 400:
+                    errors.append(f"HTTP {response.status_code}")
+                    return
+                if streamed and first is not None:
+                    first_bytes.append(first)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    async def worker():
+        for i in remaining:
+            await one(i)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_sample": errors[:3],
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+    if first_bytes:
+        result["first_byte_p50_ms"] = round(percentile(first_bytes, 50) * 1000, 1)
+        result["first_byte_p95_ms"] = round(percentile(first_bytes, 95) * 1000, 1)
+    return result
+
+
+async def run(app: App, stubs: StubServers, names: List[str], total: int, concurrency: int) -> Dict[str, Any]:
+    run_id = datetime.now().strftime("%H%M%S")
+    available = scenarios(stubs)
+    results: Dict[str, Any] = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=app.url, timeout=120, limits=limits) as client:
+        client.cookies.set("session", app.session_cookie())
+        print(f"{'scenario':<14} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb ms':>8} {'errors':>7} {'rss MB':>7}")
+        for name in names:
+            # One warm-up request so discovery documents, pools and parsers are loaded
+            # Ids are unique per scenario so no scenario is served from another's caches
+            await drive(client, available[name], f"{run_id}-{name}-warmup", 1, 1)
+            result = await drive(client, available[name], f"{run_id}-{name}", total, concurrency)
+            result["memory"] = memory_mb(app.process.pid)
+            results[name] = result
+            print(
+                f"{name:<14} {result['throughput_rps']:>8.1f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+                f"{result['p99_ms']:>9.1f} {result.get('first_byte_p50_ms', 0):>8.1f} {result['errors']:>7} "
+                f"{result['memory']['rss_mb']:>7.1f}"
+            )
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]):
+    print(f"\nChange against {previous.get('commit')} ({previous.get('timestamp')}):")
+    print(f"{'scenario':<14} {'req/s':>9} {'p95':>9} {'p99':>9} {'rss':>9}")
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        print(
+            f"{name:<14} {change(result['throughput_rps'], old['throughput_rps']):>9} "
+            f"{change(result['p95_ms'], old['p95_ms']):>9} {change(result['p99_ms'], old['p99_ms']):>9} "
+            f"{change(result['memory']['rss_mb'], old['memory']['rss_mb']):>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", default=",".join(scenarios(StubServers())), help="comma-separated scenario names")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/load-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--search-latency", type=float, default=StubSettings.search_latency)
+    parser.add_argument("--site-latency", type=float, default=StubSettings.site_latency)
+    parser.add_argument("--site-median-kb", type=float, default=StubSettings.site_median_kb)
+    parser.add_argument("--groq-first-token", type=float, default=StubSettings.groq_first_token)
+    parser.add_argument("--groq-tokens-per-second", type=float, default=StubSettings.groq_tokens_per_second)
+    parser.add_argument("--groq-completion-tokens", type=int, default=StubSettings.groq_completion_tokens)
+    parser.add_argument("--gmail-latency", type=float, default=StubSettings.gmail_latency)
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    settings = StubSettings(
+        search_latency=args.search_latency,
+        groq_first_token=args.groq_first_token,
+        groq_tokens_per_second=args.groq_tokens_per_second,
+        groq_completion_tokens=args.groq_completion_tokens,
+        site_latency=args.site_latency,
+        site_median_kb=args.site_median_kb,
+        gmail_latency=args.gmail_latency,
+    )
+    stubs = StubServers(settings)
+    unknown = set(names) - set(scenarios(stubs))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    stubs.start()
+    with tempfile.TemporaryDirectory() as workdir:
+        app = App(stubs.env(), workdir)
+        app.start()
+        try:
+            print(f"{args.requests} requests per scenario, concurrency {args.concurrency}\n")
+            results = asyncio.run(run(app, stubs, names, args.requests, args.concurrency))
+            memory = memory_mb(app.process.pid)
+        finally:
+            app.stop()
+            stubs.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "settings": {"requests": args.requests, "concurrency": args.concurrency, "stubs": vars(settings)},
+        "memory": memory,
+        "scenarios": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{report['commit'] or 'unknown'}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nPeak app RSS {memory['peak_rss_mb']} MB; results written to {output}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Local stand-ins for the app's upstreams, used by the load tests.
+
+- search: Google Custom Search JSON API (GET /customsearch/v1), results point at the site farm
+- groq:   OpenAI-compatible chat completions (POST /openai/v1/chat/completions), plain and
+          streamed, with configurable time to first token and token rate
+- sites:  a farm of static pages (GET /site/{seed}/{page}.html) with realistic sizes and markup
+- gmail:  Gmail API messages.send and users.getProfile
+
+Each stub is a small Starlette app; `StubServers` runs them on free local ports in a
+background thread. Run this module directly to keep them up for manual testing:
+
+    python -m benchmarks.stubs
+"""
+import asyncio
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = (
+    "research data model system network analysis performance result method study energy market policy "
+    "health climate growth process software design security value people science history language "
+    "report evidence effect change level rate increase trend source review paper team report"
+).split()
+
+
+@dataclass
+class StubSettings:
+    search_latency: float = 0.05  # seconds per search call
+    groq_first_token: float = 0.2  # seconds before the first token
+    groq_tokens_per_second: float = 500.0
+    groq_completion_tokens: int = 200
+    site_latency: float = 0.1  # median seconds per page, with jitter
+    site_median_kb: float = 60.0  # median page size; sizes are log-normal like real pages
+    gmail_latency: float = 0.15
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def jitter(seconds: float, rng: random.Random = random) -> float:
+    return max(0.0, rng.lognormvariate(0, 0.5) * seconds)
+
+
+def search_app(settings: StubSettings, site_url: str) -> Starlette:
+    async def custom_search(request: Request):
+        await asyncio.sleep(jitter(settings.search_latency))
+        query = request.query_params.get("q", "")
+        num = int(request.query_params.get("num", "10"))
+        # Every query gets its own pages so repeated runs don't only measure the page cache
+        seed = hashlib.sha1(query.encode()).hexdigest()[:12]
+        items = [
+            {"title": f"Result {i} for {query}", "link": f"{site_url}/site/{seed}/{i}.html", "snippet": "..."}
+            for i in range(num)
+        ]
+        return JSONResponse({"items": items, "searchInformation": {"totalResults": str(num)}})
+
+    return Starlette(routes=[Route("/customsearch/v1", custom_search)])
+
+
+def completion_text(tokens: int, rng: random.Random) -> list:
+    return [(" " if i else "") + rng.choice(WORDS) for i in range(tokens)]
+
+
+def groq_app(settings: StubSettings) -> Starlette:
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        prompt_tokens = sum(len(message.get("content", "")) for message in payload.get("messages", [])) // 4 + 1
+        tokens = min(settings.groq_completion_tokens, payload.get("max_tokens") or settings.groq_completion_tokens)
+        words = completion_text(tokens, random.Random(prompt_tokens))
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": tokens, "total_tokens": prompt_tokens + tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if not payload.get("stream"):
+            await asyncio.sleep(settings.groq_first_token + tokens / settings.groq_tokens_per_second)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def events():
+            await asyncio.sleep(settings.groq_first_token)
+            # Send tokens in ~10ms bursts rather than sleeping per token
+            per_burst = max(1, int(settings.groq_tokens_per_second / 100))
+            for start in range(0, len(words), per_burst):
+                for word in words[start:start + per_burst]:
+                    chunk = {"id": completion_id, "choices": [{"index": 0, "delta": {"content": word}}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(per_burst / settings.groq_tokens_per_second)
+            final = {"id": completion_id, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(routes=[Route("/openai/v1/chat/completions", chat_completions, methods=["POST"])])
+
+
+def site_page(seed: str, page: str, median_kb: float) -> str:
+    """
+    Deterministic page with navigation, scripts, boilerplate and article text
+    """
+    rng = random.Random(f"{seed}/{page}")
+    target = int(rng.lognormvariate(0, 0.6) * median_kb * 1024)
+    nav = "".join(f'<li><a href="/nav/{i}">{rng.choice(WORDS).title()}</a></li>' for i in range(25))
+    script = "<script>window.dataLayer=window.dataLayer||[];" + "x" * 2000 + "</script>"
+    parts = [
+        f"<!DOCTYPE html><html><head><title>{rng.choice(WORDS).title()} {page}</title>",
+        '<meta charset="utf-8"><style>body{font-family:sans-serif}' + ".c{margin:0}" * 100 + "</style>",
+        f"{script}</head><body><header><nav><ul>{nav}</ul></nav></header><main><article>",
+        f"<h1>{' '.join(rng.choice(WORDS) for _ in range(8)).title()}</h1>",
+    ]
+    size = sum(len(part) for part in parts)
+    while size < target:
+        paragraph = f"<p>{' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 120)))}.</p>"
+        if rng.random() < 0.1:
+            paragraph = f"<h2>{' '.join(rng.choice(WORDS) for _ in range(5)).title()}</h2>" + paragraph
+        parts.append(paragraph)
+        size += len(paragraph)
+    parts.append(f"</article></main><footer>{nav}<p>Copyright notice and cookie policy.</p></footer>{script}</body></html>")
+    return "".join(parts)
+
+
+def sites_app(settings: StubSettings) -> Starlette:
+    pages: Dict[str, str] = {}
+
+    async def page(request: Request):
+        seed, number = request.path_params["seed"], request.path_params["page"]
+        await asyncio.sleep(jitter(settings.site_latency))
+        key = f"{seed}/{number}"
+        if key not in pages:
+            pages[key] = site_page(seed, number, settings.site_median_kb)
+        return HTMLResponse(pages[key])
+
+    return Starlette(routes=[Route("/site/{seed}/{page}.html", page)])
+
+
+def gmail_app(settings: StubSettings) -> Starlette:
+    async def send(request: Request):
+        await request.body()
+        await asyncio.sleep(jitter(settings.gmail_latency))
+        return JSONResponse({"id": uuid.uuid4().hex[:16], "threadId": uuid.uuid4().hex[:16], "labelIds": ["SENT"]})
+
+    async def profile(request: Request):
+        await asyncio.sleep(jitter(settings.gmail_latency))
+        return JSONResponse({"emailAddress": "bench@example.com", "messagesTotal": 0, "threadsTotal": 0})
+
+    return Starlette(routes=[
+        Route("/gmail/v1/users/{user_id}/messages/send", send, methods=["POST"]),
+        Route("/upload/gmail/v1/users/{user_id}/messages/send", send, methods=["POST"]),
+        Route("/gmail/v1/users/{user_id}/profile", profile),
+    ])
+
+
+class StubServers:
+    """
+    All four stubs on free local ports, served from one background thread
+    """
+
+    def __init__(self, settings: Optional[StubSettings] = None):
+        self.settings = settings or StubSettings()
+        self.ports = {name: free_port() for name in ("search", "groq", "sites", "gmail")}
+        self._servers = []
+        self._thread: Optional[threading.Thread] = None
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.ports[name]}"
+
+    def env(self) -> Dict[str, str]:
+        """
+        Environment variables pointing the app at the stubs
+        """
+        return {
+            "GOOGLE_SEARCH_BASE_URL": self.url("search"),
+            "GOOGLE_API_KEY": "bench",
+            "GOOGLE_SEARCH_ENGINE_ID": "bench",
+            "GROQ_BASE_URL": f"{self.url('groq')}/openai/v1",
+            "GROQ_API_KEY": "bench",
+            "GMAIL_BASE_URL": self.url("gmail"),
+        }
+
+    def start(self):
+        apps = {
+            "search": search_app(self.settings, self.url("sites")),
+            "groq": groq_app(self.settings),
+            "sites": sites_app(self.settings),
+            "gmail": gmail_app(self.settings),
+        }
+        self._servers = [
+            uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.ports[name], log_level="error", access_log=False))
+            for name, app in apps.items()
+        ]
+
+        def serve():
+            async def all_servers():
+                await asyncio.gather(*(server.serve() for server in self._servers))
+            asyncio.run(all_servers())
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        while not all(server.started for server in self._servers):
+            time.sleep(0.05)
+
+    def stop(self):
+        for server in self._servers:
+            server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    stubs = StubServers()
+    stubs.start()
+    for key, value in stubs.env().items():
+        print(f"{key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stubs.stop()
@@ -1,22 +1,56 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.sessions import SessionMiddleware
 from fastapi.responses import RedirectResponse
 import uvicorn
+import asyncio
 import os
+import sys
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Import route modules
-from routes import search, scrape, groq, email, auth
+from routes import search, scrape, groq, email, auth, research, jobs, index
+from services import bulk_email, cache, extract, gmail, job_queue, metrics, page_cache, render, sessions, startup
+from services.upstream import UpstreamRegistry
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="AI Research Assistant API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled client per upstream, shared by all requests
+    app.state.upstreams = UpstreamRegistry()
+    # Background workers for submitted jobs
+    job_queue.queue.start(jobs.handlers(app.state.upstreams))
+    # Keep the on-disk cache tiers within their expiry and size limits
+    stores = [store for store in (search.store, groq.store) if store is not None]
+    purger = asyncio.create_task(cache.purge_stores(stores)) if stores else None
+    # Load the modules routes import on first use, now or in the background (STARTUP_MODE)
+    await startup.start()
+    yield
+    if purger is not None:
+        purger.cancel()
+    await job_queue.queue.stop()
+    await app.state.upstreams.aclose()
+    # Stop background bulk email jobs before the Gmail threads they use
+    await bulk_email.sender.shutdown()
+    # Stop the HTML extraction worker processes, the headless browser and the Gmail threads
+    extract.shutdown()
+    await render.pool.close()
+    gmail.manager.shutdown()
+    sessions.store.close()
+    page_cache.cache.close()
+    # Finish indexing scraped pages, then write out passages still buffered for the local index
+    await scrape.wait_for_indexing()
+    if "services.passage_index" in sys.modules:
+        await asyncio.to_thread(sys.modules["services.passage_index"].index.close)
 
-# Configure Session Middleware (must be added before CORS)
+app = FastAPI(title="AI Research Assistant API", lifespan=lifespan)
+
+# Configure Session Middleware (must be added before CORS); the cookie holds only a session id
 app.add_middleware(
-    SessionMiddleware,
+    sessions.ServerSessionMiddleware,
+    store=sessions.store,
     secret_key=os.getenv("SESSION_SECRET_KEY", "a_secure_random_string_for_session_encryption"),
     max_age=3600,  # 1 hour
     same_site="lax",  # Changed from "none" to "lax" for better compatibility
@@ -33,12 +67,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request metrics; added last so it also times the session and CORS middleware
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include routers
 app.include_router(search.router, prefix="/api", tags=["search"])
 app.include_router(scrape.router, prefix="/api", tags=["scrape"])
 app.include_router(groq.router, prefix="/api", tags=["groq"])
 app.include_router(email.router, prefix="/api", tags=["email"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
+app.include_router(research.router, prefix="/api", tags=["research"])
+app.include_router(jobs.router, prefix="/api", tags=["jobs"])
+app.include_router(index.router, prefix="/api", tags=["index"])
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/api/startup/stats")
+async def startup_stats():
+    """
+    Report the startup mode and how long each deferred module took to load
+    """
+    return startup.stats
 
 @app.get("/", response_class=RedirectResponse, status_code=status.HTTP_302_FOUND)
 async def redirect_to_docs():
@@ -3,10 +3,8 @@ from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from typing import Optional
 import os
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-import json
+
+from services import gmail, sessions
 
 router = APIRouter()
 
@@ -19,6 +17,9 @@ SCOPES = [
 
 # Create a flow instance to manage the OAuth 2.0 Authorization Grant Flow
 def create_flow(redirect_uri: str):
+    # Imported here, as the OAuth libraries are slow to load and only the login routes need them
+    from google_auth_oauthlib.flow import Flow
+
     client_config = {
         "web": {
             "client_id": os.getenv("GMAIL_CLIENT_ID"),
@@ -48,24 +49,17 @@ async def auth_status(request: Request):
     try:
         # Print session for debugging
         # print(f"Session in status: {dict(request.session)}")
-        # Check if credentials are in the session
-        credentials_json = request.session.get("credentials")
-        # print(f"Credentials JSON: {credentials_json}")
+        # Check if credentials are in the session (parsed once per process, not per request)
+        credentials = sessions.session_credentials(request.session)
 
-        if credentials_json:
-                credentials = Credentials.from_authorized_user_info(
-                    json.loads(credentials_json)
-                )
-                
-                
+        if credentials:
                 # Check if credentials are valid
                 if credentials and not credentials.expired:
-                        # Get user email
-                        service = build('gmail', 'v1', credentials=credentials)
-                        
-                        profile = service.users().getProfile(userId='me').execute()
-                        print(f"Profile: {profile}")
-                        email = profile.get('emailAddress')
+                        # Get user email, remembered in the session after the first lookup
+                        email = request.session.get("email")
+                        if not email:
+                            email = await gmail.manager.profile_email(credentials)
+                            request.session["email"] = email
                         
                         return AuthStatus(authenticated=True, email=email)
         
@@ -96,7 +90,7 @@ async def login(request: Request):
         # Store the state in the session
         request.session["state"] = state
         
-        print(f"Session after setting state: {dict(request.session)}")
+        print(f"Session keys after setting state: {sorted(request.session)}")
         
         # Redirect to the authorization URL
         response = RedirectResponse(authorization_url)
@@ -116,7 +110,7 @@ async def callback(request: Request, code: str, state: Optional[str] = None):
     """
     try:
         print(f"Callback received with state: {state}")
-        print(f"Session in callback: {request.session}")
+        print(f"Session keys in callback: {sorted(request.session)}")
         
         # Verify state
         session_state = request.session.get("state")
@@ -161,10 +155,9 @@ async def callback(request: Request, code: str, state: Optional[str] = None):
         
         credentials = flow.credentials
         
-        # Store the credentials in the session
-        request.session["credentials"] = credentials.to_json()
-        
-        print(f"Credentials stored in session: {credentials.to_json()[:100]}...")
+        # Store the credentials in the server-side session
+        sessions.store_credentials(request.session, credentials)
+        request.session.pop("email", None)
         
         # Redirect to the frontend
         frontend_url = os.getenv("FRONTEND_URL", "http://localhost:5173")
@@ -183,18 +176,20 @@ async def logout(request: Request):
     Log out the user by removing the credentials from the session
     """
     try:
-        # Print session contents for debugging
-        print(f"Session before logout: {dict(request.session)}")
+        # Print session keys for debugging; the values include the OAuth tokens
+        print(f"Session keys before logout: {sorted(request.session)}")
         
         # Remove credentials from the session
         if "credentials" in request.session:
             print("Removing credentials from session")
+            gmail.manager.forget(sessions.session_credentials(request.session))
             del request.session["credentials"]
+            request.session.pop("email", None)
         else:
             print("No credentials found in session")
         
         # Print session after removal
-        print(f"Session after logout: {dict(request.session)}")
+        print(f"Session keys after logout: {sorted(request.session)}")
         
         # Return success response
         return {"message": "Logged out successfully"}
@@ -205,3 +200,10 @@ async def logout(request: Request):
             status_code=500,
             detail=f"Error logging out: {str(e)}"
         )
+
+@router.get("/stats")
+async def session_stats():
+    """
+    Report server-side session store and parsed credentials cache hits
+    """
+    return {**sessions.store.snapshot(), **sessions.credentials_cache.snapshot()}
@@ -1,14 +1,12 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, EmailStr
-from typing import List
+from typing import TYPE_CHECKING, List
 import os
-import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import json
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+
+from services import bulk_email, gmail, metrics, sessions
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 router = APIRouter()
 
@@ -20,67 +18,58 @@ class EmailRequest(BaseModel):
 class EmailResponse(BaseModel):
     message: str
 
+class BulkEmailRequest(BaseModel):
+    to: List[EmailStr]  # One personalised message per recipient; {{email}} and {{name}} are filled in
+    subject: str = "Response to your request"
+    content: str
+
+class BulkEmailResponse(BaseModel):
+    job_id: str
+    total: int
+    status: str
+
+async def session_credentials(req: Request) -> "Credentials":
+    """
+    Gmail credentials from the session, refreshed if they have expired
+    """
+    # Check if credentials are in the session
+    if not req.session.get("credentials"):
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated with Gmail. Please login first."
+        )
+    
+    # Get credentials from the session, parsed once per process
+    credentials = sessions.session_credentials(req.session)
+    
+    # Check if credentials are valid and refresh if needed
+    if credentials.expired and credentials.refresh_token:
+        await gmail.manager.refresh(credentials)
+        # Update the session with refreshed credentials; every worker sees them on the next request
+        sessions.store_credentials(req.session, credentials)
+    elif credentials.expired:
+        raise HTTPException(
+            status_code=401,
+            detail="Gmail credentials expired. Please login again."
+        )
+    return credentials
+
 @router.post("/email", response_model=EmailResponse)
 async def send_email(request: EmailRequest, req: Request):
     """
     Send an email using Gmail API
     """
+    from googleapiclient.errors import HttpError
+
     try:
-        # Check if credentials are in the session
-        if not req.session.get("credentials"):
-            raise HTTPException(
-                status_code=401,
-                detail="Not authenticated with Gmail. Please login first."
-            )
-        
-        # Get credentials from the session
-        credentials_json = req.session.get("credentials")
-        credentials = Credentials.from_authorized_user_info(
-            json.loads(credentials_json)
-        )
-        
-        # Check if credentials are valid and refresh if needed
-        if credentials.expired and credentials.refresh_token:
-            credentials.refresh(Request())
-            # Update the session with refreshed credentials
-            req.session["credentials"] = credentials.to_json()
-        elif credentials.expired:
-            raise HTTPException(
-                status_code=401,
-                detail="Gmail credentials expired. Please login again."
-            )
-        
-        # Create Gmail API service
-        service = build('gmail', 'v1', credentials=credentials)
-        
-        # Create a multipart message
-        message = MIMEMultipart()
-        message['to'] = ", ".join(request.to)
-        message['subject'] = request.subject
-        
-        # Add HTML body
-        html_content = f"""
-        <html>
-            <body>
-                {request.content}
-            </body>
-        </html>
-        """
-        message.attach(MIMEText(html_content, 'html'))
-        
-        # Encode the message
-        encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+        credentials = await session_credentials(req)
         
         # Create the email request
-        create_message = {
-            'raw': encoded_message
-        }
+        create_message = gmail.build_message(request.to, request.subject, request.content)
         
-        # Send the email
-        send_message = service.users().messages().send(
-            userId="me", 
-            body=create_message
-        ).execute()
+        # Send the email on the Gmail thread pool, reusing this user's service
+        with metrics.span("gmail.send", recipients=len(request.to)):
+            send_message = await gmail.manager.send(credentials, create_message)
         
         return EmailResponse(message=f"Email sent successfully. Message ID: {send_message['id']}")
     
@@ -94,3 +83,47 @@ async def send_email(request: EmailRequest, req: Request):
             status_code=500,
             detail=f"Error sending email: {str(e)}"
         )
+
+@router.post("/email/bulk", response_model=BulkEmailResponse)
+async def send_bulk_email(request: BulkEmailRequest, req: Request):
+    """
+    Queue a personalised email to every recipient and return a job id right away.
+
+    Delivery runs in the background in Gmail batch requests, paced to the per-user
+    sending quota; poll GET /email/jobs/{job_id} for progress.
+    """
+    credentials = await session_credentials(req)
+    if not request.to:
+        raise HTTPException(status_code=400, detail="No recipients given")
+
+    try:
+        job = bulk_email.sender.submit(credentials, request.to, request.subject, request.content)
+        return BulkEmailResponse(job_id=job.id, total=job.total, status=job.status)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error queueing bulk email: {str(e)}"
+        )
+
+@router.get("/email/jobs/{job_id}")
+async def bulk_email_status(job_id: str, req: Request):
+    """
+    Progress of a bulk email job started by the current user
+    """
+    if not req.session.get("credentials"):
+        raise HTTPException(
+            status_code=401,
+            detail="Not authenticated with Gmail. Please login first."
+        )
+    credentials = sessions.session_credentials(req.session)
+    job = bulk_email.sender.get(job_id, gmail.credentials_key(credentials))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@router.get("/email/stats")
+async def email_stats():
+    """
+    Report Gmail service reuse and thread pool queue wait versus execution time
+    """
+    return gmail.manager.snapshot()
@@ -1,96 +1,422 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import httpx
+import hashlib
+import json
 import os
-from typing import Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+from services import metrics, scheduler
+from services.cache import SingleFlight, SQLiteStore, TTLCache
+from services.context_packer import context_budget, estimate_tokens, pack_context
+from services.map_reduce import map_phase
+from services.upstream import upstream_client
 
 router = APIRouter()
 
+# Completion cache settings
+GROQ_CACHE_TTL = int(os.getenv("GROQ_CACHE_TTL", "86400"))
+GROQ_CACHE_MAX_ENTRIES = int(os.getenv("GROQ_CACHE_MAX_ENTRIES", "2000"))
+GROQ_CACHE_MAX_BYTES = int(os.getenv("GROQ_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+GROQ_CACHE_DB = os.getenv("GROQ_CACHE_DB", "")  # e.g. .cache/groq.sqlite3; empty keeps the cache in memory only
+GROQ_CACHE_DB_MAX_BYTES = int(os.getenv("GROQ_CACHE_DB_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Choose model - LLaMA3 or Mixtral
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama3-8b-8192") # Alternative: "mixtral-8x7b-32768"
+GROQ_MAX_TOKENS = 2048
+
+# Completion length for each map-step summary in map_reduce mode
+MAP_MAX_TOKENS = int(os.getenv("MAP_REDUCE_MAX_TOKENS", "512"))
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    return len(entry["output"].encode("utf-8"))
+
+_cache = TTLCache(
+    max_entries=GROQ_CACHE_MAX_ENTRIES,
+    ttl=GROQ_CACHE_TTL,
+    max_bytes=GROQ_CACHE_MAX_BYTES,
+    sizeof=_entry_size,
+)
+# On-disk tier, shared by workers; purged periodically from the app's lifespan
+store: Optional[SQLiteStore] = (
+    SQLiteStore(GROQ_CACHE_DB, table="groq_completions", max_bytes=GROQ_CACHE_DB_MAX_BYTES) if GROQ_CACHE_DB else None
+)
+_in_flight = SingleFlight()
+_stats = {
+    "hits": 0,
+    "store_hits": 0,
+    "misses": 0,
+    "coalesced": 0,
+    "bypassed": 0,
+    "prompt_tokens_saved": 0,
+    "completion_tokens_saved": 0,
+}
+
 class GroqRequest(BaseModel):
     prompt: str
     content: Optional[str] = ""
+    no_cache: bool = False  # Skip the completion cache lookup and ask the model again
+    pack_context: bool = True  # Keep only the most relevant passages when content exceeds the model window
+    mode: Literal["single", "map_reduce"] = "single"  # map_reduce summarizes oversized content chunk by chunk first
 
 class GroqResponse(BaseModel):
     output: str
 
+def build_payload(request: GroqRequest) -> Dict[str, Any]:
+    """
+    Build the chat completion request body for a prompt and optional web content
+    """
+    # Prepare the system message and user prompt
+    system_message = """You are a helpful research assistant. Your task is to provide accurate, 
+    concise, and relevant information. Focus on answering the user's query directly and factually.
+    If you don't have enough information to answer the query, acknowledge this limitation.
+    Provide well-structured responses with clear organization and formatting when appropriate.
+    Use bullet points or numbered lists for complex information when it improves readability."""
+
+    # Create user message with just the prompt
+    user_message = f"User Query: {request.prompt}"
+
+    # Add instructions based on whether content is provided
+    if request.content and request.content.strip():
+        content = request.content
+        instructions = "Please provide a well-structured, factual response to the query based on the web content."
+
+        # Pack the most relevant passages instead of sending more than the model can read
+        budget = context_budget(GROQ_MODEL, GROQ_MAX_TOKENS, overhead=system_message + user_message + instructions)
+        if request.pack_context and estimate_tokens(content) > budget:
+            content = pack_context(request.prompt, content, budget)
+            instructions += " Cite sources by their [number] where relevant."
+
+        user_message += f"""
+
+        Web Content:
+        {content}
+
+        {instructions}
+        """
+    else:
+        user_message += """
+
+        Please provide a well-structured, factual response to the query based on your knowledge.
+        """
+
+    return {
+        "model": GROQ_MODEL,
+        "messages": [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message}
+        ],
+        "temperature": 0.3,
+        "max_tokens": GROQ_MAX_TOKENS
+    }
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """
+    Hash of everything that determines the completion
+    """
+    relevant = {name: payload[name] for name in ("model", "messages", "temperature", "max_tokens")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _api_key() -> str:
+    # Get API key from environment variables
+    api_key = os.getenv("GROQ_API_KEY")
+
+    if not api_key:
+        raise HTTPException(
+            status_code=500,
+            detail="Groq API key not configured"
+        )
+    return api_key
+
+# Relative to the groq upstream's base URL (https://api.groq.com/openai/v1)
+GROQ_URL = "/chat/completions"
+
+def request_tokens(payload: Dict[str, Any]) -> int:
+    """
+    Tokens a completion can count against the tokens-per-minute quota: prompt plus the most it may generate
+    """
+    prompt = sum(estimate_tokens(message.get("content") or "") for message in payload.get("messages", []))
+    return prompt + (payload.get("max_tokens") or 0)
+
+def groq_error(status_code: int, body: str, headers: httpx.Headers) -> HTTPException:
+    # Pass Retry-After on so callers still throttled after our retries can back off too
+    retry_after = headers.get("retry-after")
+    return HTTPException(
+        status_code=status_code,
+        detail=f"Groq API error: {body}",
+        headers={"Retry-After": retry_after} if retry_after else None,
+    )
+
+def busy_error(error: scheduler.UpstreamBusy) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(int(error.retry_after))})
+
+async def complete(payload: Dict[str, Any], client: httpx.AsyncClient) -> Dict[str, Any]:
+    """
+    Send a chat completion request to Groq and return the decoded response
+    """
+    # Prepare the API request
+    headers = {
+        "Authorization": f"Bearer {_api_key()}",
+        "Content-Type": "application/json"
+    }
+
+    # Make the API request over the shared connection pool
+    # The scheduler queues the call within Groq's rate limits and retries 429s and 5xxs
+    with metrics.span("groq.upstream", model=payload.get("model"), streamed=False) as span:
+        try:
+            response = await scheduler.groq.send(
+                lambda: client.post(GROQ_URL, headers=headers, json=payload),
+                tokens=request_tokens(payload),
+            )
+        except scheduler.UpstreamBusy as e:
+            raise busy_error(e)
+
+        if response.status_code != 200:
+            raise groq_error(response.status_code, response.text, response.headers)
+
+        result = response.json()
+        usage = result.get("usage") or {}
+        metrics.record_tokens(usage)
+        span.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+    return result
+
+async def stream_completion(payload: Dict[str, Any], client: httpx.AsyncClient) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Stream a chat completion from Groq, yielding ("token", text) pairs and finally ("usage", usage)
+    """
+    headers = {
+        "Authorization": f"Bearer {_api_key()}",
+        "Content-Type": "application/json"
+    }
+    usage: Dict[str, int] = {}
+    started = time.perf_counter()
+    first_token = True
+
+    try:
+        upstream = scheduler.groq.stream(
+            lambda: client.stream("POST", GROQ_URL, headers=headers, json={**payload, "stream": True}),
+            tokens=request_tokens(payload),
+        )
+        async with upstream as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                raise groq_error(response.status_code, body.decode('utf-8', errors='replace'), response.headers)
+
+            # The body is a sequence of "data: {json}" lines ending with "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                # Groq reports usage on the last chunk under x_groq; OpenAI-style servers use usage
+                usage = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage") or usage
+                for choice in chunk.get("choices", []):
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        if first_token:
+                            metrics.observe("groq.first_token", time.perf_counter() - started, model=payload.get("model"))
+                            first_token = False
+                        yield "token", text
+    except scheduler.UpstreamBusy as e:
+        metrics.observe("groq.upstream", time.perf_counter() - started, ok=False, model=payload.get("model"), streamed=True)
+        raise busy_error(e)
+    except Exception:
+        metrics.observe("groq.upstream", time.perf_counter() - started, ok=False, model=payload.get("model"), streamed=True)
+        raise
+
+    metrics.observe(
+        "groq.upstream", time.perf_counter() - started, model=payload.get("model"), streamed=True,
+        prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+    )
+    metrics.record_tokens(usage)
+    yield "usage", usage
+
+async def lookup_cached(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Find a cached completion in memory or the on-disk tier and record the hit
+    """
+    entry = _cache.get(key)
+    if entry is None and store is not None:
+        entry = await store.aget(key)
+        if entry is not None:
+            _stats["store_hits"] += 1
+            _cache.set(key, entry)
+    if entry is not None:
+        _stats["hits"] += 1
+        _stats["prompt_tokens_saved"] += entry["usage"].get("prompt_tokens", 0)
+        _stats["completion_tokens_saved"] += entry["usage"].get("completion_tokens", 0)
+    return entry
+
+async def store_cached(key: str, entry: Dict[str, Any]):
+    _cache.set(key, entry)
+    if store is not None:
+        await store.aset(key, entry, GROQ_CACHE_TTL)
+
+async def cached_completion(
+    payload: Dict[str, Any],
+    client: httpx.AsyncClient,
+    bypass: bool = False,
+) -> Tuple[str, Dict[str, int]]:
+    """
+    Return (output, usage) for a payload, answering from the completion cache when possible
+    """
+    key = cache_key(payload)
+
+    if bypass:
+        _stats["bypassed"] += 1
+    else:
+        entry = await lookup_cached(key)
+        if entry is not None:
+            return entry["output"], entry["usage"]
+        if key in _in_flight:
+            _stats["coalesced"] += 1
+
+    async def load() -> Dict[str, Any]:
+        _stats["misses"] += 1
+        response_data = await complete(payload, client)
+        entry = {
+            "output": response_data["choices"][0]["message"]["content"],
+            "usage": response_data.get("usage") or {},
+        }
+        await store_cached(key, entry)
+        return entry
+
+    # Bypassing requests skip the lookup but still refresh the cache with the new answer
+    entry = await (load() if bypass else _in_flight.do(key, load))
+    return entry["output"], entry["usage"]
+
+async def map_content(request: GroqRequest, client: httpx.AsyncClient) -> GroqRequest:
+    """
+    Map step of map_reduce mode: replace content that exceeds the model window with
+    per-chunk summaries, so the regular completion becomes the reduce step
+    """
+    if request.mode != "map_reduce" or not request.content:
+        return request
+    if estimate_tokens(request.content) <= context_budget(GROQ_MODEL, GROQ_MAX_TOKENS):
+        return request
+
+    async def summarize(messages: List[Dict[str, str]]) -> str:
+        payload = {"model": GROQ_MODEL, "messages": messages, "temperature": 0.3, "max_tokens": MAP_MAX_TOKENS}
+        output, _ = await cached_completion(payload, client, bypass=request.no_cache)
+        return output
+
+    result = await map_phase(request.prompt, request.content, summarize)
+    if not result.summarized:
+        raise HTTPException(
+            status_code=504,
+            detail=f"None of the {result.chunks} content chunks could be summarized in time"
+        )
+
+    coverage = f"Summaries of {result.summarized} of {result.chunks} excerpts:"
+    summaries = "\n\n".join(result.summaries) or "None of the excerpts were relevant to the query."
+    return request.model_copy(update={"content": f"{coverage}\n\n{summaries}"})
+
+def sse(event: str, data: Any) -> str:
+    """
+    Format one Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def parse_sse(frame: str) -> Tuple[str, Any]:
+    """
+    Read back an event formatted by sse()
+    """
+    event, data = frame.strip().split("\n", 1)
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
 @router.post("/groq", response_model=GroqResponse)
-async def process_with_groq(request: GroqRequest):
+async def process_with_groq(request: GroqRequest, client: httpx.AsyncClient = Depends(upstream_client("groq"))):
     """
     Process content with Groq LLM API and return the response
     """
     try:
-        # Get API key from environment variables
-        api_key = os.getenv("GROQ_API_KEY")
-        
-        if not api_key:
-            raise HTTPException(
-                status_code=500, 
-                detail="Groq API key not configured"
-            )
-        
-        # Prepare the system message and user prompt
-        system_message = """You are a helpful research assistant. Your task is to provide accurate, 
-        concise, and relevant information. Focus on answering the user's query directly and factually.
-        If you don't have enough information to answer the query, acknowledge this limitation.
-        Provide well-structured responses with clear organization and formatting when appropriate.
-        Use bullet points or numbered lists for complex information when it improves readability."""
-        
-        # Create user message with just the prompt
-        user_message = f"User Query: {request.prompt}"
-        
-        # Add instructions based on whether content is provided
-        if request.content and request.content.strip():
-            user_message += f"""
-            
-            Web Content:
-            {request.content}
-            
-            Please provide a well-structured, factual response to the query based on the web content.
-            """
-        else:
-            user_message += """
-            
-            Please provide a well-structured, factual response to the query based on your knowledge.
-            """
-        
-        # Prepare the API request
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Choose model - LLaMA3 or Mixtral
-        model = "llama3-8b-8192" # Alternative: "mixtral-8x7b-32768"
-        
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_message}
-            ],
-            "temperature": 0.3,
-            "max_tokens": 2048
-        }
-        
-        # Make the API request
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload, timeout=60)
-            
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Groq API error: {response.text}"
-            )
-        
+        request = await map_content(request, client)
+        payload = build_payload(request)
+
         # Extract the LLM response
-        response_data = response.json()
-        llm_response = response_data["choices"][0]["message"]["content"]
-        
+        llm_response, _ = await cached_completion(payload, client, bypass=request.no_cache)
+
         return GroqResponse(output=llm_response)
-    
+
+    except HTTPException as e:
+        if e.status_code == 429:
+            # Still rate limited after the scheduler's retries: tell the client when to come back
+            raise
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing with Groq: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing with Groq: {str(e)}"
         )
+
+async def completion_events(request: GroqRequest, client: httpx.AsyncClient) -> AsyncIterator[str]:
+    """
+    Server-Sent Events for one completion: `token` events with {"content": ...} as
+    text arrives, then one `done` event with the usage stats, or an `error` event
+    with {"detail": ...}. In map_reduce mode a `status` event marks the start of
+    the map step.
+    """
+    try:
+        if request.mode == "map_reduce":
+            yield sse("status", {"stage": "map"})
+        payload = build_payload(await map_content(request, client))
+        key = cache_key(payload)
+
+        if request.no_cache:
+            _stats["bypassed"] += 1
+        else:
+            entry = await lookup_cached(key)
+            if entry is not None:
+                yield sse("token", {"content": entry["output"]})
+                yield sse("done", {"usage": entry["usage"], "cached": True})
+                return
+
+        _stats["misses"] += 1
+        parts = []
+        usage: Dict[str, int] = {}
+        async for kind, value in stream_completion(payload, client):
+            if kind == "token":
+                parts.append(value)
+                yield sse("token", {"content": value})
+            else:
+                usage = value
+
+        await store_cached(key, {"output": "".join(parts), "usage": usage})
+        yield sse("done", {"usage": usage, "cached": False})
+
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield sse("error", {"detail": f"Error processing with Groq: {detail}"})
+
+@router.post("/groq/stream")
+async def stream_with_groq(request: GroqRequest, client: httpx.AsyncClient = Depends(upstream_client("groq"))):
+    """
+    Process content with Groq LLM API and stream the response as Server-Sent Events
+    """
+    return StreamingResponse(
+        completion_events(request, client),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/groq/stats")
+async def groq_stats():
+    """
+    Report completion cache hit ratio and tokens saved, and the upstream scheduler's queue
+    """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "entries": len(_cache),
+        "bytes": _cache.bytes,
+        "hit_ratio": _stats["hits"] / lookups if lookups else 0.0,
+        "tokens_saved": _stats["prompt_tokens_saved"] + _stats["completion_tokens_saved"],
+        **_stats,
+        "scheduler": scheduler.groq.snapshot(),
+    }
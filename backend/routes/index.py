@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+import asyncio
+import time
+from typing import List, Optional
+
+from services import metrics
+
+router = APIRouter()
+
+class IndexQuery(BaseModel):
+    query: str
+    k: int = Field(10, ge=1, le=100)  # Passages to return
+
+class IndexPassage(BaseModel):
+    source: Optional[str]
+    text: str
+    score: float
+    coverage: float  # Fraction of the query's terms found in the passage
+
+class IndexResults(BaseModel):
+    passages: List[IndexPassage]
+    elapsed_ms: float
+
+@router.post("/index/query", response_model=IndexResults)
+async def query_index(request: IndexQuery):
+    """
+    Best-matching passages from previously scraped pages, ranked by BM25
+    """
+    from services import passage_index
+
+    try:
+        started = time.perf_counter()
+        with metrics.span("index.query"):
+            hits = await passage_index.index.asearch(request.query, request.k)
+        return IndexResults(
+            passages=[IndexPassage(source=hit.source, text=hit.text, score=hit.score, coverage=hit.coverage) for hit in hits],
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error querying the passage index: {str(e)}"
+        )
+
+@router.get("/index/stats")
+async def index_stats():
+    """
+    Report corpus size, segments, disk use, pending passages and query latency
+    """
+    from services import passage_index
+
+    return await asyncio.to_thread(passage_index.index.snapshot)
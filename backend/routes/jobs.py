@@ -0,0 +1,80 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Any, Dict, Optional
+
+from routes import research
+from services import scheduler
+from services.job_queue import Handler, queue
+
+router = APIRouter()
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    deduplicated: bool = False
+    progress: Optional[Dict[str, Any]] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+def job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(job_id=job["id"], **{key: value for key, value in job.items() if key in JobResponse.model_fields})
+
+def handlers(upstreams: Any) -> Dict[str, Handler]:
+    """
+    Job kinds this process can run, bound to the app's shared upstream clients
+    """
+    async def run_research(params: Dict[str, Any], report) -> Dict[str, Any]:
+        # Nobody is waiting on the response, so interactive requests go first
+        scheduler.priority.set(scheduler.PRIORITY_BACKGROUND)
+        return await research.run_research(research.ResearchRequest(**params), upstreams, report)
+
+    return {"research": run_research}
+
+@router.post("/jobs/research", response_model=JobResponse, status_code=202)
+async def submit_research(request: research.ResearchRequest):
+    """
+    Queue a research task and return its job id immediately.
+
+    Submitting the same request while an identical job is still queued or running
+    returns that job instead of starting another.
+    """
+    try:
+        job = await queue.submit("research", request.model_dump())
+        return job_response(job)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error submitting job: {str(e)}"
+        )
+
+@router.get("/jobs/stats")
+async def job_stats():
+    """
+    Report job counts by status and this process's worker activity
+    """
+    return await queue.snapshot()
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """
+    Poll a job's status, progress and, once completed, its result
+    """
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
+
+@router.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running job
+    """
+    job = await queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_response(job)
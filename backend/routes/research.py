@@ -0,0 +1,160 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal, Optional
+
+from routes import groq, scrape, search
+from routes.groq import parse_sse, sse
+from services import metrics
+from services.fetcher import Fetcher, run_bounded
+
+router = APIRouter()
+
+# Answer from the local passage index, skipping search and scraping, when at least this many
+# indexed passages each contain at least this fraction of the query's terms
+RESEARCH_INDEX_MIN_PASSAGES = int(os.getenv("RESEARCH_INDEX_MIN_PASSAGES", "5"))
+RESEARCH_INDEX_MIN_COVERAGE = float(os.getenv("RESEARCH_INDEX_MIN_COVERAGE", "0.8"))
+
+# Passages retrieved from the index for one question
+RESEARCH_INDEX_PASSAGES = 40
+
+class ResearchRequest(BaseModel):
+    query: str
+    num: int = Field(5, ge=1, le=10)  # Search results to read
+    mode: Literal["single", "map_reduce"] = "single"
+    no_cache: bool = False
+    max_chars: int = 100000  # Cap on combined page text; 0 keeps everything (useful with map_reduce)
+    use_index: bool = True  # Answer from previously scraped passages when they cover the question
+
+async def local_pages(query: str) -> Optional[Dict[str, str]]:
+    """
+    Indexed passages that cover the query, grouped into pages by source; None when coverage is too thin
+    """
+    from services import passage_index
+
+    try:
+        with metrics.span("index.query"):
+            hits = await passage_index.index.asearch(query, RESEARCH_INDEX_PASSAGES)
+    except Exception:
+        # Fall back to live search and scraping
+        return None
+    hits = [hit for hit in hits if hit.coverage >= RESEARCH_INDEX_MIN_COVERAGE]
+    if len(hits) < RESEARCH_INDEX_MIN_PASSAGES:
+        return None
+    passages: Dict[str, List[str]] = {}
+    for hit in hits:
+        passages.setdefault(hit.source or "local index", []).append(hit.text)
+    return {source: "\n\n".join(texts) for source, texts in passages.items()}
+
+async def research_events(request: ResearchRequest, upstreams: Any) -> AsyncIterator[str]:
+    """
+    Run search -> scrape -> LLM on the server and stream progress as Server-Sent Events.
+
+    Events, in order: `links` with the search results, one `page` per finished link
+    (as soon as it finishes, in completion order), `generation` when the prompt is
+    sent (with the characters of repeated text left out), then the completion's own `token`/`done` events. Failures end the stream
+    with an `error` event.
+
+    When the local passage index already covers the question, search and scraping are
+    skipped: `links` lists the indexed sources used (with `"index": true`) and no `page`
+    events follow.
+    """
+    from services import dedup
+
+    started = time.perf_counter()
+
+    def elapsed_ms() -> int:
+        return int((time.perf_counter() - started) * 1000)
+
+    try:
+        local = await local_pages(request.query) if request.use_index and not request.no_cache else None
+        errors: Dict[str, str] = {}
+        if local is not None:
+            links = list(local)
+            yield sse("links", {"links": links, "index": True, "elapsed_ms": elapsed_ms()})
+            texts = local
+        else:
+            links = await search.cached_links(request.query, request.num, upstreams.get("google_search"))
+            yield sse("links", {"links": links, "elapsed_ms": elapsed_ms()})
+
+            # Every link starts fetching immediately; pages are extracted while others are still downloading
+            scraper = scrape.PageScraper(Fetcher(upstreams.get("web")))
+            texts = {}
+            fetched = run_bounded(links, scraper.try_page_text)
+            try:
+                async for url, result in fetched:
+                    text, error = result if result is not None else (None, "deadline exceeded")
+                    if text is not None:
+                        texts[url] = text
+                    else:
+                        errors[url] = error
+                    yield sse("page", {
+                        "url": url,
+                        "ok": text is not None,
+                        "chars": len(text or ""),
+                        "error": error,
+                        "elapsed_ms": elapsed_ms(),
+                    })
+            finally:
+                # Cancel pages still in flight when the client disconnects mid-stream
+                await fetched.aclose()
+
+        # Mirrors and syndicated copies would otherwise send the same text to the model several times
+        texts, removed = await asyncio.to_thread(dedup.dedupe_pages, links, texts)
+        pages = {url: scrape.format_page(url, text) for url, text in texts.items()}
+        pages.update((url, scrape.format_failure(url, error)) for url, error in errors.items())
+        content = scrape.combine_pages(links, pages, request.max_chars)
+        yield sse("generation", {"stage": "started", "chars_removed": removed["chars_removed"], "elapsed_ms": elapsed_ms()})
+
+        groq_request = groq.GroqRequest(
+            prompt=request.query,
+            content=content,
+            mode=request.mode,
+            no_cache=request.no_cache,
+        )
+        async for event in groq.completion_events(groq_request, upstreams.get("groq")):
+            yield event
+
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield sse("error", {"detail": f"Error during research: {detail}"})
+
+@router.post("/research")
+async def research(request: ResearchRequest, http_request: Request):
+    """
+    Answer a research question end to end in one request, streaming progress
+    """
+    return StreamingResponse(
+        research_events(request, http_request.app.state.upstreams),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def run_research(request: ResearchRequest, upstreams: Any, report: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Run the research pipeline to completion for a background job, reporting each stage
+    as progress, and return the answer with its sources
+    """
+    links, parts = [], []
+    pages = {"ok": 0, "failed": 0}
+    async for frame in research_events(request, upstreams):
+        event, data = parse_sse(frame)
+        if event == "token":
+            parts.append(data["content"])
+        elif event == "links":
+            links = data["links"]
+            report({"stage": "index" if data.get("index") else "scraping", "links": len(links)})
+        elif event == "page":
+            pages["ok" if data["ok"] else "failed"] += 1
+            report({"stage": "scraping", "pages": dict(pages)})
+        elif event in ("generation", "status"):
+            report({"stage": "generation"})
+        elif event == "done":
+            report({"stage": "done"})
+            return {"output": "".join(parts), "links": links, "pages": pages, "usage": data["usage"], "cached": data["cached"]}
+        elif event == "error":
+            raise RuntimeError(data["detail"])
+    raise RuntimeError("Research ended without an answer")
@@ -1,88 +1,304 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
 import httpx
-from bs4 import BeautifulSoup
-from typing import List
-import re
-from requests_html import HTMLSession
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from services import extract, metrics, page_cache, render
+from services.fetcher import Fetcher, run_bounded
+from services.upstream import upstream_client
 
 router = APIRouter()
 
+# Pages being added to the local passage index in the background; kept referenced until done
+_indexing: Set[asyncio.Task] = set()
+
 class ScrapeRequest(BaseModel):
     links: List[str]
+    max_chars: int = 100000  # Truncate the combined text (e.g., for LLM token limits); 0 keeps everything
+    dedup: bool = True  # Drop sentences repeated within a page or from an earlier page (mirrors, syndicated copies)
 
 class ScrapeResponse(BaseModel):
     content: str
+    chars_removed: int = 0  # Characters of repeated text dropped before truncation
+
+class ScrapeStreamRequest(BaseModel):
+    links: List[str]
+    max_chars: int = 0  # Stop once this much text has been streamed, cancelling unfinished pages; 0 reads every link
+    max_chars_per_page: int = 0  # Truncate each page's text; 0 keeps everything
+    max_pages: int = 0  # Stop after this many pages came back with text; 0 reads every link
+    dedup: bool = True  # Drop sentences already sent in an earlier record or repeated within the page
+
+def format_page(url: str, page_content: str) -> str:
+    # Add source information
+    return f"Source: {url}\n\n{page_content}\n\n{'='*50}\n"
+
+def format_failure(url: str, error: str) -> str:
+    return f"Failed to scrape {url}: {error}\n\n"
+
+def combine_pages(links: List[str], pages: Dict[str, str], max_chars: int) -> str:
+    """
+    Join formatted pages in link order, truncating to `max_chars` (0 keeps everything)
+    """
+    # Combine all content, keeping the order of the links
+    combined_content = "\n".join(pages[url] for url in links if url in pages)
+
+    # Limit content length if needed (e.g., for LLM token limits)
+    if max_chars and len(combined_content) > max_chars:
+        combined_content = combined_content[:max_chars] + "...[content truncated due to length]"
+    return combined_content
+
+async def index_page(url: str, page_content: str):
+    """
+    Add a page's passages to the local passage index
+    """
+    from services import passage_index
+
+    try:
+        with metrics.span("index.add", url=url) as span:
+            span.set(passages=await passage_index.index.aadd_page(url, page_content))
+    except Exception:
+        # The page was still returned; it just isn't searchable locally
+        pass
+
+async def wait_for_indexing():
+    """
+    Wait for pages still being indexed in the background, e.g. before shutdown
+    """
+    if _indexing:
+        await asyncio.gather(*_indexing, return_exceptions=True)
+
+class PageScraper:
+    """
+    Fetch, render and extract a single page; shared by all links of one scrape
+    """
+
+    def __init__(self, fetcher: Fetcher):
+        self.fetcher = fetcher
+
+    async def try_page_text(self, url: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        (text, None) for a scraped page, (None, error) for a failed one
+        """
+        try:
+            return await self.page_text(url), None
+        except Exception as e:
+            return None, str(e)
+
+    async def page_text(self, url: str, info: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Extracted text of one page. If `info` is given it is filled in with how the page
+        was obtained: HTTP status, cache use, bytes downloaded and per-stage timings.
+        """
+        info = info if info is not None else {}
+        info.setdefault("timings", {})
+
+        # Serve fresh cache entries straight from disk
+        cached = await page_cache.cache.get(url)
+        if cached is not None and cached.entry.fresh:
+            page_cache.cache.record_hit()
+            info.update(status=None, cache="hit", bytes=0)
+            return cached.text
+
+        # Get the page content, letting the origin answer 304 for stale entries
+        result = await self.fetcher.fetch(url, headers=page_cache.cache.conditional_headers(cached))
+        info["timings"]["fetch_ms"] = int(result.elapsed * 1000)
+        metrics.observe("scrape.fetch", result.elapsed, ok=not result.error, url=url, status=result.status)
+        info.update(status=result.status, bytes=len((result.text or "").encode("utf-8", "replace")))
+        if result.error:
+            raise Exception(result.error)
+        if result.status == 304 and cached is not None:
+            await page_cache.cache.revalidated(cached, result.headers)
+            info["cache"] = "revalidated"
+            return cached.text
+
+        page_cache.cache.record_miss()
+        info["cache"] = "miss"
+        html = result.text
+
+        # Identical bodies (mirrors, unchanged re-downloads) were already extracted
+        page_content = await page_cache.cache.text_for_body(html)
+        if page_content is None:
+            page_content = await self.extract_page(url, html, info)
+
+        if result.status == 200:
+            await page_cache.cache.put(url, html, result.headers, page_content)
+            self.index_page(url, page_content)
+        return page_content
+
+    def index_page(self, url: str, page_content: str):
+        """
+        Add the page's passages to the local index in the background, so later questions can
+        be answered without scraping and this request doesn't wait for the index
+        """
+        task = asyncio.create_task(index_page(url, page_content))
+        _indexing.add(task)
+        task.add_done_callback(_indexing.discard)
+
+    async def extract_page(self, url: str, html: str, info: Optional[Dict[str, Any]] = None) -> str:
+        timings = info.setdefault("timings", {}) if info is not None else {}
+
+        # Parse off the event loop
+        with metrics.span("scrape.parse", url=url, bytes=len(html)) as span:
+            page_content = await extract.extract(html)
+        timings["parse_ms"] = int(span.seconds * 1000)
+
+        # Render JavaScript only when the static page came back nearly empty
+        should_render = render.needs_render(html, page_content)
+        render.pool.record_decision(should_render)
+        if info is not None:
+            info["rendered"] = should_render
+        if should_render:
+            try:
+                with metrics.span("scrape.render", url=url) as span:
+                    rendered_html = await render.pool.render(url)
+                page_content = await extract.extract(rendered_html)
+            except Exception:
+                # Fall back to whatever the static page gave us
+                pass
+            timings["render_ms"] = int(span.seconds * 1000)
+        return page_content
+
+    async def page_record(self, url: str) -> Dict[str, Any]:
+        """
+        Text of one page plus how it was obtained, for the streaming scrape; failures are recorded, not raised
+        """
+        started = time.perf_counter()
+        info: Dict[str, Any] = {"url": url, "ok": False, "status": None, "cache": None, "rendered": False,
+                                "bytes": 0, "timings": {}}
+        try:
+            info["text"] = await self.page_text(url, info)
+            info["ok"] = True
+            info["error"] = None
+        except Exception as e:
+            info["text"] = ""
+            info["error"] = str(e)
+        info["timings"]["total_ms"] = int((time.perf_counter() - started) * 1000)
+        return info
 
 @router.post("/scrape", response_model=ScrapeResponse)
-async def scrape(request: ScrapeRequest):
+async def scrape(request: ScrapeRequest, client: httpx.AsyncClient = Depends(upstream_client("web"))):
     """
     Scrape content from a list of URLs and return cleaned text
     """
+    from services import dedup
+
     try:
         if not request.links:
             return ScrapeResponse(content="No links provided to scrape.")
-        
-        all_content = []
-        
-        # Create a session for requests-html
-        session = HTMLSession()
-        
-        for url in request.links:
-            try:
-                # Get the page content
-                response = session.get(url, timeout=10)
-                
-                # Render JavaScript if needed
-                if "javascript" in response.text.lower() or "dynamic" in response.text.lower():
-                    response.html.render(timeout=20)
-                
-                # Parse with BeautifulSoup
-                soup = BeautifulSoup(response.html.html, 'html.parser')
-                
-                # Remove script, style, and other non-content elements
-                for element in soup(['script', 'style', 'header', 'footer', 'nav', 'aside', 'iframe', 'noscript']):
-                    element.decompose()
-                
-                # Extract text from paragraphs, headings, and list items
-                content_elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
-                
-                # Get text from each element
-                content = []
-                for element in content_elements:
-                    text = element.get_text().strip()
-                    if text and len(text) > 20:  # Filter out short fragments
-                        content.append(text)
-                
-                # Join the text with newlines
-                page_content = "\n\n".join(content)
-                
-                # Clean up the text
-                page_content = re.sub(r'\s+', ' ', page_content)  # Replace multiple spaces with a single space
-                page_content = re.sub(r'\n\s*\n', '\n\n', page_content)  # Remove empty lines
-                
-                # Add source information
-                all_content.append(f"Source: {url}\n\n{page_content}\n\n{'='*50}\n")
-            
-            except Exception as e:
-                all_content.append(f"Failed to scrape {url}: {str(e)}\n\n")
-                continue
-        
-        # Combine all content
-        combined_content = "\n".join(all_content)
-        
-        # Limit content length if needed (e.g., for LLM token limits)
-        if len(combined_content) > 100000:
-            combined_content = combined_content[:100000] + "...[content truncated due to length]"
-        
-        return ScrapeResponse(content=combined_content)
-    
+
+        texts: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+
+        scraper = PageScraper(Fetcher(client))
+        # Fetch every link concurrently; links still running at the deadline are dropped
+        async for url, result in run_bounded(request.links, scraper.try_page_text):
+            text, error = result if result is not None else (None, "deadline exceeded")
+            if text is not None:
+                texts[url] = text
+            else:
+                errors[url] = error
+
+        chars_removed = 0
+        if request.dedup:
+            texts, removed = await asyncio.to_thread(dedup.dedupe_pages, request.links, texts)
+            chars_removed = removed["chars_removed"]
+        pages = {url: format_page(url, text) for url, text in texts.items()}
+        pages.update((url, format_failure(url, error)) for url, error in errors.items())
+
+        return ScrapeResponse(content=combine_pages(request.links, pages, request.max_chars), chars_removed=chars_removed)
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error during scraping: {str(e)}"
         )
+
+async def scrape_records(request: ScrapeStreamRequest, client: httpx.AsyncClient) -> AsyncIterator[str]:
+    """
+    One NDJSON line per link, in completion order, then a summary line with `"done": true`.
+
+    Stops early once `max_chars` of text or `max_pages` pages have been sent; unfinished
+    pages are cancelled, as they are when the client disconnects.
+    """
+    from services import dedup
+
+    started = time.perf_counter()
+    scraper = PageScraper(Fetcher(client))
+    deduplicator = dedup.Deduplicator() if request.dedup else None
+    sent_chars = ok_pages = records = chars_removed = 0
+    stopped_early = False
+
+    pages = run_bounded(request.links, scraper.page_record)
+    try:
+        async for url, record in pages:
+            if record is None:
+                record = {"url": url, "ok": False, "status": None, "cache": None, "rendered": False,
+                          "bytes": 0, "timings": {}, "text": "", "error": "deadline exceeded"}
+
+            text = record["text"]
+            record["chars_removed"] = 0
+            if deduplicator is not None and text:
+                # Pages are compared in completion order: text already streamed is the copy that stays
+                removed_before = deduplicator.stats["chars_removed"]
+                text = await asyncio.to_thread(deduplicator.page, url, text)
+                record["chars_removed"] = deduplicator.stats["chars_removed"] - removed_before
+                chars_removed += record["chars_removed"]
+            limits = [len(text)]
+            if request.max_chars_per_page:
+                limits.append(request.max_chars_per_page)
+            if request.max_chars:
+                limits.append(request.max_chars - sent_chars)
+            record["text"] = text[:min(limits)]
+            record["chars"] = len(record["text"])
+            record["truncated"] = record["chars"] < len(text)
+
+            sent_chars += record["chars"]
+            ok_pages += record["ok"]
+            records += 1
+            record["elapsed_ms"] = int((time.perf_counter() - started) * 1000)
+            yield json.dumps(record) + "\n"
+
+            if (request.max_chars and sent_chars >= request.max_chars) or (request.max_pages and ok_pages >= request.max_pages):
+                stopped_early = records < len(request.links)
+                break
     finally:
-        # Close the session
-        if 'session' in locals():
-            session.close()
+        # Cancel pages still in flight now rather than when the generator is collected
+        await pages.aclose()
+
+    yield json.dumps({
+        "done": True,
+        "pages": records,
+        "ok": ok_pages,
+        "chars": sent_chars,
+        "chars_removed": chars_removed,
+        "stopped_early": stopped_early,
+        "elapsed_ms": int((time.perf_counter() - started) * 1000),
+    }) + "\n"
+
+@router.post("/scrape/stream")
+async def scrape_stream(request: ScrapeStreamRequest, client: httpx.AsyncClient = Depends(upstream_client("web"))):
+    """
+    Scrape a list of URLs, streaming each page as an NDJSON record as soon as it finishes
+    """
+    return StreamingResponse(
+        scrape_records(request, client),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/scrape/stats")
+async def scrape_stats():
+    """
+    Report page cache counters, render pool size, render/no-render decision counts and repeated text removed
+    """
+    from services import dedup
+
+    return {
+        "cache": await asyncio.to_thread(page_cache.cache.snapshot),
+        "render": render.pool.snapshot(),
+        "dedup": dict(dedup.stats),
+    }
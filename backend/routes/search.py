@@ -1,64 +1,136 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import httpx
 import os
-from typing import List
+import re
+from typing import List, Optional
+
+from services import metrics
+from services.cache import SingleFlight, SQLiteStore, TTLCache
+from services.upstream import upstream_client
 
 router = APIRouter()
 
+# Search result cache settings
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1000"))
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", "")  # e.g. .cache/search.sqlite3; empty keeps the cache in memory only
+SEARCH_CACHE_DB_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_DB_MAX_ENTRIES", "100000"))
+
+_cache = TTLCache(max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL)
+# On-disk tier, shared by workers; purged periodically from the app's lifespan
+store: Optional[SQLiteStore] = (
+    SQLiteStore(SEARCH_CACHE_DB, table="search_results", max_entries=SEARCH_CACHE_DB_MAX_ENTRIES) if SEARCH_CACHE_DB else None
+)
+_in_flight = SingleFlight()
+_stats = {"hits": 0, "store_hits": 0, "misses": 0, "coalesced": 0}
+
 class SearchQuery(BaseModel):
     query: str
+    num: int = Field(5, ge=1, le=10)  # Google returns at most 10 results per call
 
 class SearchResults(BaseModel):
     links: List[str]
 
+def normalize_query(query: str) -> str:
+    """
+    Reduce a query to the form used as its cache key: lower case, no punctuation, single spaces
+    """
+    query = re.sub(r'[^\w\s]', ' ', query.lower())
+    return " ".join(query.split())
+
+async def fetch_links(query: str, num: int, client: httpx.AsyncClient) -> List[str]:
+    """
+    Call the Google Custom Search API and return the result URLs
+    """
+    # Get API key and search engine ID from environment variables
+    api_key = os.getenv("GOOGLE_API_KEY")
+    search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+
+    if not api_key or not search_engine_id:
+        raise HTTPException(
+            status_code=500,
+            detail="Google API credentials not configured"
+        )
+
+    # Prepare the API request; the client's base URL points at googleapis.com
+    url = "/customsearch/v1"
+    params = {
+        "key": api_key,
+        "cx": search_engine_id,
+        "q": query,
+        "num": num
+    }
+
+    # Make the API request over the shared connection pool
+    with metrics.span("google_search") as span:
+        response = await client.get(url, params=params)
+        span.set(status=response.status_code)
+
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Google API error: {response.text}"
+        )
+
+    # Extract URLs from the response
+    search_results = response.json()
+    return [item["link"] for item in search_results.get("items", [])]
+
+async def cached_links(query: str, num: int, client: httpx.AsyncClient) -> List[str]:
+    """
+    Search through the result cache; identical concurrent queries share one upstream call
+    """
+    key = f"{normalize_query(query)}|{num}"
+
+    links = _cache.get(key)
+    if links is not None:
+        _stats["hits"] += 1
+        return list(links)
+
+    if key in _in_flight:
+        _stats["coalesced"] += 1
+
+    async def load() -> List[str]:
+        # Another worker on this host may already have the answer
+        if store is not None:
+            stored = await store.aget(key)
+            if stored is not None:
+                _stats["store_hits"] += 1
+                _cache.set(key, stored)
+                return stored
+
+        _stats["misses"] += 1
+        links = await fetch_links(query, num, client)
+        _cache.set(key, links)
+        if store is not None:
+            await store.aset(key, links, SEARCH_CACHE_TTL)
+        return links
+
+    return list(await _in_flight.do(key, load))
+
 @router.post("/search", response_model=SearchResults)
-async def search(query: SearchQuery):
+async def search(query: SearchQuery, client: httpx.AsyncClient = Depends(upstream_client("google_search"))):
     """
     Search for relevant URLs using Google Custom Search API
     """
     try:
-        # Get API key and search engine ID from environment variables
-        api_key = os.getenv("GOOGLE_API_KEY")
-        search_engine_id = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
-        
-        if not api_key or not search_engine_id:
-            raise HTTPException(
-                status_code=500, 
-                detail="Google API credentials not configured"
-            )
-        
-        # Prepare the API request
-        url = "https://www.googleapis.com/customsearch/v1"
-        params = {
-            "key": api_key,
-            "cx": search_engine_id,
-            "q": query.query,
-            "num": 5  # Get top 5 results
-        }
-        
-        # Make the API request
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Google API error: {response.text}"
-            )
-        
-        # Extract URLs from the response
-        search_results = response.json()
-        links = []
-        
-        if "items" in search_results:
-            for item in search_results["items"]:
-                links.append(item["link"])
-        
+        links = await cached_links(query.query, query.num, client)
         return SearchResults(links=links)
-    
+
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error during search: {str(e)}"
         )
+
+@router.get("/search/stats")
+async def search_stats():
+    """
+    Report search cache counters
+    """
+    return {
+        "entries": len(_cache),
+        "in_flight": _in_flight.in_flight(),
+        **_stats,
+    }
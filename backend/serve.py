@@ -0,0 +1,152 @@
+"""
+Pre-forking server: loads the libraries once, then forks worker processes that share them.
+
+Usage (from the backend directory):
+    python serve.py [--workers 4] [--host 0.0.0.0] [--port 10000]
+
+`uvicorn --workers N` starts each worker as a fresh interpreter, so every worker imports
+FastAPI, NumPy, the Google client libraries and the rest on its own, and holds its own
+copy. Here the parent imports them before forking and freezes them out of the garbage
+collector, so their pages stay shared between workers (copy-on-write) instead of being
+duplicated. Each worker then imports the app itself: our modules open SQLite databases
+and start threads, neither of which survives a fork.
+
+All workers accept connections from one listening socket. A worker that dies is
+replaced; SIGINT or SIGTERM stops them all. Workers share the session store, the job
+queue, the page cache and the passage index through SQLite and disk, but each has its
+own in-memory caches. Set PROMETHEUS_MULTIPROC_DIR for /metrics to cover all workers.
+"""
+import argparse
+import gc
+import importlib
+import os
+import signal
+import sys
+import time
+from typing import Dict
+
+import uvicorn
+
+from services import startup
+
+# Libraries every worker needs, imported in the parent so their code is shared; the
+# optional ones that aren't installed are skipped
+SHARED_MODULES = [
+    "fastapi",
+    "fastapi.middleware.cors",
+    "fastapi.responses",
+    "pydantic",
+    "email_validator",
+    "httpx",
+    "h2.connection",
+    "itsdangerous",
+    "prometheus_client",
+    "dotenv",
+    "uvicorn.protocols.http.h11_impl",
+    "uvicorn.protocols.http.httptools_impl",
+    "uvicorn.lifespan.on",
+    "uvicorn.loops.uvloop",
+]
+
+# A worker that exits sooner than this after starting is failing to start, not crashing;
+# it is not replaced, so a broken app stops the server instead of forking in a loop
+MIN_WORKER_UPTIME = 5.0
+
+
+def preload():
+    """
+    Import the shared libraries and the modules the app otherwise loads on first use
+    """
+    for name in SHARED_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+    startup.preload()
+
+
+def run_worker(config: uvicorn.Config, sock):
+    # Back to default signal handling; uvicorn installs its own
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(config: uvicorn.Config, workers: int) -> int:
+    sock = config.bind_socket()
+    preload()
+    # Objects created so far are never collected, so collections in the workers don't
+    # touch (and copy) the pages holding them
+    gc.freeze()
+
+    children: Dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(config, sock)
+            except BaseException:
+                code = 1
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Serving on {config.host}:{config.port} with {workers} preloaded workers (pids {', '.join(map(str, children))})")
+
+    exit_code = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            # Drop the worker's live gauges (requests in flight, queue depths)
+            from prometheus_client import multiprocess
+
+            multiprocess.mark_process_dead(pid)
+        if started is None or stopping:
+            continue
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            print(f"Worker {pid} exited during startup (status {status}); stopping")
+            exit_code = 1
+            stop(signal.SIGTERM, None)
+            continue
+        print(f"Worker {pid} exited (status {status}); starting a new one")
+        spawn()
+    sock.close()
+    return exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=10000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    config = uvicorn.Config("main:app", host=args.host, port=args.port, log_level=args.log_level)
+    sys.exit(serve(config, max(1, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from services import gmail, metrics
+from services.rate_limit import TokenBucket
+
+# Messages per Gmail batch HTTP request (Gmail recommends at most 50)
+GMAIL_BULK_BATCH_SIZE = int(os.getenv("GMAIL_BULK_BATCH_SIZE", "20"))
+
+# Sustained sends per second per user. messages.send costs 100 quota units and
+# Gmail allows 250 units per user per second, so 2.5/s stays inside the quota.
+GMAIL_SEND_RATE = float(os.getenv("GMAIL_SEND_RATE", "2.5"))
+
+# Sends allowed in a burst before the sustained rate applies
+GMAIL_SEND_BURST = float(os.getenv("GMAIL_SEND_BURST", str(GMAIL_BULK_BATCH_SIZE)))
+
+# Attempts per recipient before giving up on retryable errors
+GMAIL_BULK_MAX_ATTEMPTS = int(os.getenv("GMAIL_BULK_MAX_ATTEMPTS", "5"))
+
+# Seconds a finished job's status stays available
+GMAIL_BULK_JOB_TTL = int(os.getenv("GMAIL_BULK_JOB_TTL", "3600"))
+
+# Upper bound on the wait between retry rounds
+MAX_BACKOFF_SECONDS = 60.0
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Optional[Exception]) -> bool:
+    """
+    Rate limits and server errors are worth retrying; bad addresses and auth errors are not
+    """
+    if error is None:
+        return True
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        # Transport failures (timeouts, dropped connections)
+        return True
+    status = int(status)
+    if status == 403 and "ratelimitexceeded" in str(error).lower().replace(" ", ""):
+        return True
+    return status in RETRYABLE_STATUSES
+
+
+def personalize(template: str, recipient: str) -> str:
+    """
+    Fill {{email}} and {{name}} placeholders for one recipient
+    """
+    name = recipient.split("@")[0].replace(".", " ").title()
+    return template.replace("{{email}}", recipient).replace("{{name}}", name)
+
+
+@dataclass
+class BulkEmailJob:
+    id: str
+    owner: str
+    total: int
+    status: str = "queued"
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    errors: List[Dict[str, str]] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pending": self.total - self.sent - self.failed,
+            "retries": self.retries,
+            "errors": self.errors[-50:],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class BulkEmailSender:
+    """
+    Delivers personalised copies of a message to many recipients in the background,
+    through Gmail batch requests, rate limited per user and retried with backoff
+    """
+
+    def __init__(
+        self,
+        batch_size: int = GMAIL_BULK_BATCH_SIZE,
+        rate: float = GMAIL_SEND_RATE,
+        burst: float = GMAIL_SEND_BURST,
+        max_attempts: int = GMAIL_BULK_MAX_ATTEMPTS,
+    ):
+        self.batch_size = batch_size
+        self.rate = rate
+        self.burst = max(burst, batch_size)
+        self.max_attempts = max_attempts
+        self.jobs: Dict[str, BulkEmailJob] = {}
+        self._limiters: Dict[str, TokenBucket] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _limiter(self, owner: str) -> TokenBucket:
+        # Gmail quotas are per user, so is the rate limit
+        if owner not in self._limiters:
+            self._limiters[owner] = TokenBucket(rate=self.rate, burst=self.burst)
+        return self._limiters[owner]
+
+    def _purge(self):
+        cutoff = time.time() - GMAIL_BULK_JOB_TTL
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self.jobs[job_id]
+
+    def submit(self, credentials: Any, recipients: List[str], subject: str, content: str) -> BulkEmailJob:
+        """
+        Queue a bulk send and return immediately; delivery runs as a background task
+        """
+        self._purge()
+        recipients = list(dict.fromkeys(recipients))
+        job = BulkEmailJob(id=uuid.uuid4().hex, owner=gmail.credentials_key(credentials), total=len(recipients))
+        self.jobs[job.id] = job
+
+        messages = [
+            (recipient, gmail.build_message([recipient], personalize(subject, recipient), personalize(content, recipient)))
+            for recipient in recipients
+        ]
+        task = asyncio.create_task(self._run(job, credentials, messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[BulkEmailJob]:
+        job = self.jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    async def _run(self, job: BulkEmailJob, credentials: Any, messages: List[Tuple[str, Dict[str, str]]]):
+        job.status = "running"
+        job.started_at = time.time()
+        limiter = self._limiter(job.owner)
+        # (recipient, message, attempts so far)
+        pending = [(recipient, message, 0) for recipient, message in messages]
+        backoff_round = 0
+
+        try:
+            while pending:
+                batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                await limiter.acquire(len(batch))
+
+                try:
+                    with metrics.span("gmail.send_batch", messages=len(batch)):
+                        results = await gmail.manager.send_batch(credentials, [message for _, message, _ in batch])
+                except Exception as e:
+                    # The whole batch request failed, e.g. a dropped connection
+                    results = [(None, e)] * len(batch)
+
+                retry = []
+                for (recipient, message, attempts), (response, error) in zip(batch, results):
+                    if error is None and response is not None:
+                        job.sent += 1
+                    elif is_retryable(error) and attempts + 1 < self.max_attempts:
+                        retry.append((recipient, message, attempts + 1))
+                    else:
+                        job.failed += 1
+                        job.errors.append({"recipient": recipient, "error": str(error)})
+
+                if retry:
+                    job.retries += len(retry)
+                    backoff_round += 1
+                    # Exponential backoff with jitter so retries don't land in lockstep
+                    delay = min(MAX_BACKOFF_SECONDS, 2 ** backoff_round) * random.uniform(0.5, 1.5)
+                    await asyncio.sleep(delay)
+                    pending = retry + pending
+                else:
+                    backoff_round = 0
+
+            if job.failed == 0:
+                job.status = "completed"
+            elif job.sent == 0:
+                job.status = "failed"
+            else:
+                job.status = "completed_with_errors"
+
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    async def shutdown(self):
+        """
+        Cancel running jobs
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+# Process-wide sender used by the email routes
+sender = BulkEmailSender()
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+# Seconds between sweeps of expired and over-budget rows from the SQLite cache tiers
+CACHE_PURGE_INTERVAL = float(os.getenv("CACHE_PURGE_INTERVAL", "600"))
+
+
+class TTLCache:
+    """
+    In-memory LRU cache whose entries expire after a time-to-live.
+
+    Bounded by entry count and, when `max_bytes` is given, by the total of
+    `sizeof(value)` over all entries.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 0,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.bytes = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, _, value = item
+        if time.time() >= expires_at:
+            self.pop(key)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self.pop(key)
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Never let one oversized value flush the whole cache
+            return
+        self._data[key] = (time.time() + (self.ttl if ttl is None else ttl), size, value)
+        self.bytes += size
+        while len(self._data) > self.max_entries or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            _, (_, evicted_size, _) = self._data.popitem(last=False)
+            self.bytes -= evicted_size
+
+    def pop(self, key: Hashable):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[1]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `fn` unless a call for `key` is already in flight, in which case await that one
+        """
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        # Shield so one cancelled caller doesn't cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+
+class SQLiteStore:
+    """
+    Key/value store with expiry in a SQLite file; shared by every worker on the host.
+
+    Expired rows, and the oldest rows beyond `max_entries` rows or `max_bytes` of stored
+    values, are deleted by `purge`, which `purge_stores` runs periodically.
+    """
+
+    def __init__(self, path: str, table: str = "cache", max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires_at ON {table} (expires_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def purge(self) -> int:
+        """
+        Delete expired rows, then the rows written longest ago (earliest expiry) past the
+        entry and byte limits; returns the number of rows deleted
+        """
+        deleted = self.purge_expired()
+        with self._lock, self._conn:
+            if self.max_entries is not None:
+                deleted += self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+            if self.max_bytes is not None:
+                deleted += self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM "
+                    f"(SELECT key, SUM(length(value)) OVER (ORDER BY expires_at DESC, key) AS total FROM {self.table}) "
+                    "WHERE total > ?)",
+                    (self.max_bytes,),
+                ).rowcount
+        return deleted
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl: float):
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+async def purge_stores(stores: List[SQLiteStore], interval: float = CACHE_PURGE_INTERVAL):
+    """
+    Purge the stores now and every `interval` seconds until cancelled; run as a background task
+    """
+    while True:
+        for store in stores:
+            try:
+                await asyncio.to_thread(store.purge)
+            except sqlite3.OperationalError:
+                # Another worker is writing; the next sweep catches up
+                pass
+        await asyncio.sleep(interval)
@@ -0,0 +1,183 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Context window of the models we use, in tokens
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Optional hard cap on packed context tokens, applied on top of the model window
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+
+# Target passage size in words
+PASSAGE_WORDS = int(os.getenv("CONTEXT_PASSAGE_WORDS", "120"))
+
+# Passages shorter than this are navigation crumbs, captions and other boilerplate
+MIN_PASSAGE_WORDS = int(os.getenv("CONTEXT_MIN_PASSAGE_WORDS", "12"))
+
+# Tokens kept free for chat formatting and estimation error
+SAFETY_MARGIN_TOKENS = 256
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SOURCE_HEADER = re.compile(r'^Source: (\S+)[ \t]*$', re.MULTILINE)
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_TOKEN = re.compile(r'\w+')
+_SEPARATOR = re.compile(r'\n*={10,}\n*')
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the "
+    "this to was were what when where which who why will with".split()
+)
+
+
+@dataclass
+class Passage:
+    source: Optional[str]
+    text: str
+    position: int  # Order in the original content, used to break ties
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for English text (about four characters per token)
+    """
+    return len(text) // 4 + 1
+
+
+def context_budget(model: str, max_tokens: int, overhead: str = "") -> int:
+    """
+    Tokens available for web content once the prompt and the completion are accounted for
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    budget = window - max_tokens - estimate_tokens(overhead) - SAFETY_MARGIN_TOKENS
+    if CONTEXT_TOKEN_BUDGET > 0:
+        budget = min(budget, CONTEXT_TOKEN_BUDGET)
+    return max(0, budget)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def split_pages(content: str) -> List[Dict[str, Optional[str]]]:
+    """
+    Split combined scrape output back into {"source", "text"} pages
+    """
+    headers = list(_SOURCE_HEADER.finditer(content))
+    if not headers:
+        return [{"source": None, "text": content}]
+    pages = []
+    for index, match in enumerate(headers):
+        end = headers[index + 1].start() if index + 1 < len(headers) else len(content)
+        text = _SEPARATOR.split(content[match.end():end])[0]
+        pages.append({"source": match.group(1), "text": text.strip()})
+    return pages
+
+
+def split_passages(content: str, passage_words: int = PASSAGE_WORDS) -> List[Passage]:
+    """
+    Cut every page into passages of roughly `passage_words` words on sentence boundaries
+    """
+    passages: List[Passage] = []
+
+    def emit(source, words):
+        if words:
+            passages.append(Passage(source=source, text=" ".join(words), position=len(passages)))
+
+    for page in split_pages(content):
+        current: List[str] = []
+        for sentence in _SENTENCE_END.split(page["text"]):
+            words = sentence.split()
+            # Break up run-on "sentences" (tables, lists flattened to one line)
+            while len(words) > passage_words * 2:
+                emit(page["source"], current)
+                current = []
+                emit(page["source"], words[:passage_words])
+                words = words[passage_words:]
+            if current and len(current) + len(words) > passage_words:
+                emit(page["source"], current)
+                current = []
+            current.extend(words)
+        emit(page["source"], current)
+    return passages
+
+
+def is_boilerplate(passage: Passage) -> bool:
+    words = passage.text.split()
+    if len(words) < MIN_PASSAGE_WORDS:
+        return True
+    # Mostly numbers, symbols or URLs
+    letters = sum(character.isalpha() for character in passage.text)
+    return letters < 0.5 * len(passage.text)
+
+
+def bm25_scores(query: str, passages: List[Passage]) -> "np.ndarray":
+    """
+    BM25 score of every passage against the query, computed over a passage x term matrix
+    """
+    import numpy as np
+
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not passages or not terms:
+        return np.zeros(len(passages), dtype=np.float32)
+    term_index = {term: index for index, term in enumerate(terms)}
+
+    passage_tokens = [tokenize(passage.text) for passage in passages]
+    lengths = np.fromiter((len(tokens) for tokens in passage_tokens), dtype=np.float32, count=len(passages))
+    flat = [token for tokens in passage_tokens for token in tokens]
+    term_ids = np.fromiter((term_index.get(token, -1) for token in flat), dtype=np.int64, count=len(flat))
+    passage_ids = np.repeat(np.arange(len(passages)), lengths.astype(np.int64))
+
+    # Term frequencies for query terms only
+    hits = term_ids >= 0
+    tf = np.zeros((len(passages), len(terms)), dtype=np.float32)
+    np.add.at(tf, (passage_ids[hits], term_ids[hits]), 1)
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(passages) - df + 0.5) / (df + 0.5))
+    average_length = max(float(lengths.mean()), 1.0)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / average_length)
+    return ((tf * (BM25_K1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def pack_context(query: str, content: str, token_budget: int) -> str:
+    """
+    Keep the passages most relevant to the query that fit in `token_budget` tokens.
+
+    Passages are numbered and attributed to their source so the model can cite them.
+    """
+    passages = [passage for passage in split_passages(content) if not is_boilerplate(passage)]
+    if not passages:
+        return ""
+    scores = bm25_scores(query, passages)
+
+    # Best first; earlier passages win ties so unscored content keeps its order
+    ranked = sorted(range(len(passages)), key=lambda index: (-scores[index], passages[index].position))
+
+    packed = []
+    used = 0
+    for index in ranked:
+        passage = passages[index]
+        block = f"[{len(packed) + 1}] Source: {passage.source or 'provided content'}\n{passage.text}"
+        cost = estimate_tokens(block) + 1
+        if used + cost > token_budget:
+            # A shorter passage further down may still fit
+            continue
+        packed.append(block)
+        used += cost
+        if token_budget - used < MIN_PASSAGE_WORDS:
+            break
+    return "\n\n".join(packed)
@@ -0,0 +1,198 @@
+import itertools
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Estimated Jaccard similarity (over word pairs) above which two sentences count as the same
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.75"))
+
+# Sentences shorter than this are too generic to fingerprint; they go only with a removed run around them
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "6"))
+
+# MinHash signature length, split into LSH bands of `_ROWS` values; two sentences become
+# candidates when any band matches, which at 16 x 4 finds 99% of pairs at similarity 0.7
+_PERMUTATIONS = 64
+_BANDS = 16
+_ROWS = _PERMUTATIONS // _BANDS
+
+_SENTENCE = re.compile(r'(?<=[.!?])\s+')
+_WORD = re.compile(r'\w+')
+
+# Multiply-add hash family standing in for random permutations of 64-bit word pair hashes.
+# Words are hashed with Python's string hash, which differs between processes but not within
+# one; signatures are only ever compared inside the Deduplicator that computed them.
+_rng = np.random.default_rng(0x5EED)
+_MULTIPLIERS = _rng.integers(1, 2**63, _PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_INCREMENTS = _rng.integers(0, 2**63, _PERMUTATIONS, dtype=np.uint64)
+_PAIR_MIX = np.uint64(0x9E3779B97F4A7C15)
+_BAND_MIX = np.uint64(0xBF58476D1CE4E5B9)
+
+# Totals over every deduplicated page in this process
+stats = {"pages": 0, "chars": 0, "chars_removed": 0, "sentences_removed": 0}
+
+
+def signatures(words: List[List[str]]) -> np.ndarray:
+    """
+    MinHash signature of each sentence's set of adjacent word pairs, one row per sentence.
+
+    All pairs of all sentences are hashed and permuted in single array operations, and
+    `minimum.reduceat` takes each sentence's minimum, so the cost is linear in the text.
+    Every sentence needs at least two words.
+    """
+    counts = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+    hashes = np.array(list(map(hash, itertools.chain.from_iterable(words))), dtype=np.int64).view(np.uint64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Pairs that would straddle two sentences are dropped
+    pairs = hashes[:-1] * _PAIR_MIX + hashes[1:]
+    keep = np.ones(len(pairs), dtype=bool)
+    keep[starts[1:] - 1] = False
+    pairs = pairs[keep]
+    pair_starts = starts - np.arange(len(starts))
+
+    # One row per permutation keeps the reduction running along contiguous memory
+    permuted = _MULTIPLIERS[:, None] * pairs + _INCREMENTS[:, None]
+    return np.minimum.reduceat(permuted, pair_starts, axis=1).T
+
+
+def band_keys(signature: np.ndarray) -> np.ndarray:
+    """
+    One 64-bit key per LSH band (and sentence), mixing the band's rows together
+    """
+    rows = signature.reshape(len(signature), _BANDS, _ROWS)
+    keys = rows[:, :, 0].copy()
+    for row in range(1, _ROWS):
+        keys = keys * _BAND_MIX + rows[:, :, row]
+    return keys
+
+
+class Deduplicator:
+    """
+    Drops sentences that repeat, nearly word for word, something earlier in the same page
+    or in a page seen before; feed pages in order of preference.
+
+    Each fingerprinted sentence is looked up in one hash table per LSH band, so a page costs
+    time linear in its length whatever was seen before. A run of sentences repeated from
+    another page is replaced by a short note naming the page that kept them, so the source
+    stays attributed; repeats within a page are simply dropped.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, min_words: int = DEDUP_MIN_WORDS):
+        self.threshold = threshold
+        self.min_words = min_words
+        self._buckets: List[Dict[int, int]] = [{} for _ in range(_BANDS)]
+        self._signatures: List[np.ndarray] = []
+        self._sources: List[Optional[str]] = []
+        self.stats = {"pages": 0, "chars": 0, "chars_removed": 0, "sentences_removed": 0}
+
+    def _original(self, signature: np.ndarray, keys: List[int]) -> Optional[int]:
+        """
+        Earlier sentence this one nearly repeats, checked on the full signature; None if there is none
+        """
+        checked = set()
+        for band, key in enumerate(keys):
+            candidate = self._buckets[band].get(key)
+            if candidate is None or candidate in checked:
+                continue
+            checked.add(candidate)
+            if np.count_nonzero(self._signatures[candidate] == signature) >= self.threshold * _PERMUTATIONS:
+                return candidate
+        return None
+
+    @staticmethod
+    def _close_run(run: Optional[Tuple[Optional[str], int, str]], source: Optional[str], kept: List[str]) -> int:
+        """
+        Note where a removed run came from, unless the note would be longer than the run;
+        returns the characters saved
+        """
+        if run is None:
+            return 0
+        origin, chars, separator = run
+        if origin == source:
+            return chars
+        note = f"[Repeated from {origin}]{separator or ' '}"
+        if len(note) >= chars:
+            # Attribution costs more than the repeat; drop the run silently
+            return chars
+        kept.append(note)
+        return chars - len(note)
+
+    def page(self, source: Optional[str], text: str) -> str:
+        """
+        The page's text with repeated sentences removed
+        """
+        sentences = _SENTENCE.split(text)
+        # Whitespace that followed each sentence, kept when the sentence is
+        separators = [match.group() for match in _SENTENCE.finditer(text)] + [""]
+        words = [_WORD.findall(sentence.lower()) for sentence in sentences]
+        long_enough = [len(sentence) >= max(2, self.min_words) for sentence in words]
+        fingerprinted = [index for index, flag in enumerate(long_enough) if flag]
+
+        # For each removed sentence, the source that kept the original
+        origins: List[Optional[str]] = [None] * len(sentences)
+        removed = [False] * len(sentences)
+        if fingerprinted:
+            rows = signatures([words[index] for index in fingerprinted])
+            keys = band_keys(rows).tolist()
+            for row, index in enumerate(fingerprinted):
+                original = self._original(rows[row], keys[row])
+                if original is not None:
+                    removed[index] = True
+                    origins[index] = self._sources[original]
+                    continue
+                sentence_id = len(self._signatures)
+                self._signatures.append(rows[row])
+                self._sources.append(source)
+                for band, key in enumerate(keys[row]):
+                    self._buckets[band].setdefault(key, sentence_id)
+
+        # Short sentences between two removed ones go with them
+        following = [False] * len(sentences)
+        after = False
+        for index in reversed(range(len(sentences))):
+            following[index] = after
+            if long_enough[index]:
+                after = removed[index]
+        before: Optional[int] = None
+        for index in range(len(sentences)):
+            if long_enough[index]:
+                before = index
+            elif before is not None and removed[before] and following[index]:
+                removed[index] = True
+                origins[index] = origins[before]
+
+        kept: List[str] = []
+        chars_removed = sentences_removed = 0
+        # Runs of removed sentences with the same origin, each as (origin, characters, last separator)
+        run: Optional[Tuple[Optional[str], int, str]] = None
+        for sentence, separator, drop, origin in zip(sentences, separators, removed, origins):
+            if drop and run is not None and run[0] == origin:
+                run = (origin, run[1] + len(sentence) + len(separator), separator)
+            elif drop:
+                chars_removed += self._close_run(run, source, kept)
+                run = (origin, len(sentence) + len(separator), separator)
+            else:
+                chars_removed += self._close_run(run, source, kept)
+                run = None
+                kept.extend((sentence, separator))
+            sentences_removed += drop
+        chars_removed += self._close_run(run, source, kept)
+
+        for counters in (self.stats, stats):
+            counters["pages"] += 1
+            counters["chars"] += len(text)
+            counters["chars_removed"] += chars_removed
+            counters["sentences_removed"] += sentences_removed
+        return "".join(kept).rstrip()
+
+
+def dedupe_pages(links: List[str], pages: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    Remove repeated sentences from pages taken in link order (so higher-ranked results keep
+    shared text), and return the pages with counts of what was removed
+    """
+    deduplicator = Deduplicator()
+    deduped = {url: deduplicator.page(url, pages[url]) for url in links if url in pages}
+    return deduped, deduplicator.stats
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
+
+# Elements that never hold article text
+DROP_TAGS = ['script', 'style', 'header', 'footer', 'nav', 'aside', 'iframe', 'noscript']
+
+# Elements whose text we keep
+CONTENT_TAGS = ['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li']
+
+# Fragments this short are usually buttons, captions or menu entries
+MIN_FRAGMENT_LENGTH = 20
+
+DEFAULT_BACKEND = os.getenv("EXTRACT_BACKEND", "lxml")
+
+# Number of extraction processes; 0 runs extraction inline on the calling thread
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_WHITESPACE = re.compile(r'\s+')
+_EMPTY_LINES = re.compile(r'\n\s*\n')
+
+
+def _clean(fragments: List[str]) -> str:
+    """
+    Join text fragments and normalise whitespace
+    """
+    content = [text for text in fragments if text and len(text) > MIN_FRAGMENT_LENGTH]
+    page_content = "\n\n".join(content)
+    page_content = _WHITESPACE.sub(' ', page_content)  # Replace multiple spaces with a single space
+    page_content = _EMPTY_LINES.sub('\n\n', page_content)  # Remove empty lines
+    return page_content
+
+
+def extract_bs4(html: str) -> str:
+    """
+    Extract text with BeautifulSoup's pure-Python html.parser
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Remove script, style, and other non-content elements
+    for element in soup(DROP_TAGS):
+        element.decompose()
+
+    # Get text from paragraphs, headings, and list items
+    return _clean([element.get_text().strip() for element in soup.find_all(CONTENT_TAGS)])
+
+
+def extract_lxml(html: str) -> str:
+    """
+    Extract text with lxml's C parser; produces the same text as extract_bs4
+    """
+    from lxml import etree
+    from lxml import html as lxml_html
+
+    if not html or not html.strip():
+        return ""
+
+    try:
+        root = lxml_html.document_fromstring(html)
+    except ValueError:
+        # Unicode strings with an XML encoding declaration must be passed as bytes
+        root = lxml_html.document_fromstring(html.encode('utf-8'))
+    except etree.ParserError:
+        return ""
+
+    # Remove non-content elements but keep the text that follows them
+    for element in list(root.iter(*DROP_TAGS)):
+        element.drop_tree()
+
+    return _clean([element.text_content().strip() for element in root.iter(*CONTENT_TAGS)])
+
+
+BACKENDS: Dict[str, Callable[[str], str]] = {
+    "bs4": extract_bs4,
+    "lxml": extract_lxml,
+}
+
+
+def extract_text(html: str, backend: Optional[str] = None) -> str:
+    """
+    Extract readable text from an HTML document with the chosen backend
+    """
+    name = backend or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown extraction backend: {name}")
+    return BACKENDS[name](html)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+    return _pool
+
+
+async def extract(html: str, backend: Optional[str] = None) -> str:
+    """
+    Extract text in the process pool so parsing never blocks the event loop
+    """
+    if EXTRACT_WORKERS <= 0:
+        return extract_text(html, backend)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), extract_text, html, backend)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed on a huge page); start a fresh pool for later calls
+        shutdown()
+        raise
+
+
+def shutdown():
+    """
+    Stop the extraction processes
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+from urllib.parse import urlsplit
+
+import httpx
+
+T = TypeVar("T")
+Item = TypeVar("Item")
+
+# Default limits, overridable through environment variables
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "10"))
+DEFAULT_PER_HOST_CONCURRENCY = int(os.getenv("SCRAPE_PER_HOST_CONCURRENCY", "2"))
+DEFAULT_FETCH_TIMEOUT = float(os.getenv("SCRAPE_FETCH_TIMEOUT", "10"))
+DEFAULT_DEADLINE = float(os.getenv("SCRAPE_DEADLINE", "25"))
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+}
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: Optional[int] = None
+    text: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.status is not None and self.status < 400
+
+
+class Fetcher:
+    """
+    Fetch pages concurrently with a global and a per-host concurrency cap
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        per_host_concurrency: int = DEFAULT_PER_HOST_CONCURRENCY,
+        timeout: float = DEFAULT_FETCH_TIMEOUT,
+    ):
+        self.client = client
+        self.timeout = timeout
+        self.per_host_concurrency = per_host_concurrency
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._hosts[host]
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> FetchResult:
+        """
+        Fetch a single URL, waiting for a free host slot and a free global slot
+        """
+        start = time.perf_counter()
+        try:
+            # Take the host slot first so one slow host cannot hog global slots
+            async with self._host_semaphore(url):
+                async with self._global:
+                    response = await self.client.get(
+                        url,
+                        headers={**DEFAULT_HEADERS, **(headers or {})},
+                        timeout=self.timeout,
+                        follow_redirects=True,
+                    )
+            return FetchResult(
+                url=url,
+                status=response.status_code,
+                text=response.text,
+                headers=dict(response.headers),
+                elapsed=time.perf_counter() - start,
+            )
+        except Exception as e:
+            return FetchResult(url=url, error=str(e) or type(e).__name__, elapsed=time.perf_counter() - start)
+
+
+async def run_bounded(
+    items: Iterable[Item],
+    worker: Callable[[Item], Awaitable[T]],
+    deadline: Optional[float] = DEFAULT_DEADLINE,
+) -> AsyncIterator[Tuple[Item, Optional[T]]]:
+    """
+    Run `worker` for every item concurrently and yield (item, result) pairs as they complete.
+
+    Items still pending when the deadline expires are cancelled and yielded with a
+    result of None, so callers always see every item exactly once.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = {asyncio.ensure_future(worker(item)): item for item in items}
+    end = loop.time() + deadline if deadline else None
+
+    try:
+        pending = set(tasks)
+        while pending:
+            timeout = max(0.0, end - loop.time()) if end is not None else None
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                yield tasks[task], task.result()
+
+        # Deadline hit: give up on whatever is left
+        for task in pending:
+            task.cancel()
+        for task in pending:
+            yield tasks[task], None
+    finally:
+        # Also covers the consumer closing the iterator early
+        for task in tasks:
+            if not task.done():
+                task.cancel()
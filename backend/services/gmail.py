@@ -0,0 +1,290 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.cache import SingleFlight, TTLCache
+
+# Account email addresses kept per process, one per set of credentials
+GMAIL_PROFILE_CACHE_SIZE = int(os.getenv("GMAIL_PROFILE_CACHE_SIZE", "1024"))
+
+# Seconds a looked-up profile email address is trusted
+GMAIL_PROFILE_TTL = int(os.getenv("GMAIL_PROFILE_TTL", "3600"))
+
+# Threads doing blocking Gmail calls; also the limit on concurrent Gmail calls
+GMAIL_MAX_WORKERS = int(os.getenv("GMAIL_MAX_WORKERS", "8"))
+
+# Seconds allowed for one Gmail HTTP round trip
+GMAIL_HTTP_TIMEOUT = float(os.getenv("GMAIL_HTTP_TIMEOUT", "30"))
+
+GMAIL_DISCOVERY_URL = "https://gmail.googleapis.com/$discovery/rest?version=v1"
+
+# Overrides the Gmail API root URL, e.g. to point at a local stand-in; empty uses Google's
+GMAIL_BASE_URL = os.getenv("GMAIL_BASE_URL", "")
+
+
+def credentials_key(credentials: Any) -> str:
+    """
+    Stable identity of a user's credentials; the refresh token survives access-token refreshes
+    """
+    identity = credentials.refresh_token or credentials.token or ""
+    return hashlib.sha256(f"{credentials.client_id}:{identity}".encode()).hexdigest()
+
+
+def build_message(to: List[str], subject: str, content: str) -> Dict[str, str]:
+    """
+    Gmail API message body for an HTML email
+    """
+    # Create a multipart message
+    message = MIMEMultipart()
+    message['to'] = ", ".join(to)
+    message['subject'] = subject
+
+    # Add HTML body
+    html_content = f"""
+    <html>
+        <body>
+            {content}
+        </body>
+    </html>
+    """
+    message.attach(MIMEText(html_content, 'html'))
+
+    # Encode the message
+    return {'raw': base64.urlsafe_b64encode(message.as_bytes()).decode()}
+
+
+class GmailExecutor:
+    """
+    Runs blocking google-api-python-client calls on a dedicated, bounded thread pool.
+
+    Keeps Gmail traffic off the event loop and away from the default executor, and
+    records how long calls wait for a thread versus how long they run.
+    """
+
+    def __init__(self, max_workers: int = GMAIL_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        # Guards the timings, which the pool's threads update concurrently
+        self._timings_lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "queue_wait_seconds_total": 0.0,
+            "queue_wait_seconds_max": 0.0,
+            "exec_seconds_total": 0.0,
+            "exec_seconds_max": 0.0,
+        }
+
+    def http(self, credentials: Any) -> Any:
+        """
+        Authorized HTTP object for the calling worker thread; httplib2 is not thread-safe,
+        so each thread keeps its own connection pool
+        """
+        import google_auth_httplib2
+        import httplib2
+
+        if not hasattr(self._local, "http"):
+            self._local.http = httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT)
+        return google_auth_httplib2.AuthorizedHttp(credentials, http=self._local.http)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gmail")
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            wait = started - submitted
+            with self._timings_lock:
+                self.stats["queue_wait_seconds_total"] += wait
+                self.stats["queue_wait_seconds_max"] = max(self.stats["queue_wait_seconds_max"], wait)
+            try:
+                return fn(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._timings_lock:
+                    self.stats["exec_seconds_total"] += elapsed
+                    self.stats["exec_seconds_max"] = max(self.stats["exec_seconds_max"], elapsed)
+
+        self.stats["calls"] += 1
+        self.stats["in_flight"] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, timed)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._timings_lock:
+            stats = dict(self.stats)
+        calls = stats["calls"] or 1
+        return {
+            "max_workers": self.max_workers,
+            **stats,
+            "queue_wait_seconds_avg": stats["queue_wait_seconds_total"] / calls,
+            "exec_seconds_avg": stats["exec_seconds_total"] / calls,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+class GmailClientManager:
+    """
+    Builds one Gmail API service from the parsed discovery document and shares it between
+    users; their requests are authorized with each caller's credentials when executed.
+
+    The async methods run every blocking Gmail call on the manager's GmailExecutor.
+    """
+
+    def __init__(
+        self,
+        max_profiles: int = GMAIL_PROFILE_CACHE_SIZE,
+        profile_ttl: int = GMAIL_PROFILE_TTL,
+        executor: Optional[GmailExecutor] = None,
+    ):
+        self.executor = executor or GmailExecutor()
+        self._discovery_document: Optional[dict] = None
+        self._service: Any = None
+        self._profiles = TTLCache(max_entries=max_profiles, ttl=profile_ttl)
+        self._profile_lookups = SingleFlight()
+        self.stats = {"profile_hits": 0, "profile_misses": 0}
+
+    def discovery_document(self) -> dict:
+        """
+        Gmail's discovery document, loaded and parsed once per process
+        """
+        if self._discovery_document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+
+            document = get_static_doc("gmail", "v1")
+            if document is None:
+                # Older client libraries don't bundle discovery documents
+                import httplib2
+
+                _, document = httplib2.Http(timeout=10).request(GMAIL_DISCOVERY_URL)
+            document = json.loads(document)
+            if GMAIL_BASE_URL:
+                root_url = GMAIL_BASE_URL.rstrip("/") + "/"
+                document.update(rootUrl=root_url, baseUrl=root_url + document.get("servicePath", ""), mtlsRootUrl=root_url)
+            self._discovery_document = document
+        return self._discovery_document
+
+    def service(self) -> Any:
+        """
+        Gmail API service shared by all users, built once per process
+        """
+        if self._service is None:
+            import httplib2
+            from googleapiclient.discovery import build_from_document
+
+            # The service holds no credentials: every request is executed with an HTTP object
+            # authorized by the caller's current credentials, so a refreshed token is always used
+            self._service = build_from_document(
+                self.discovery_document(), http=httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT)
+            )
+        return self._service
+
+    async def execute(self, credentials: Any, request_factory: Callable[[Any], Any]) -> Any:
+        """
+        Build a request from the shared service and execute it on the Gmail thread pool as the user
+        """
+        request = request_factory(self.service())
+        return await self.executor.run(lambda: request.execute(http=self.executor.http(credentials)))
+
+    async def send(self, credentials: Any, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Send a raw MIME message
+        """
+        return await self.execute(credentials, lambda service: service.users().messages().send(userId="me", body=body))
+
+    async def send_batch(
+        self,
+        credentials: Any,
+        bodies: List[Dict[str, Any]],
+    ) -> List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Send several messages in one HTTP request through Gmail's batch endpoint.
+
+        Returns one (response, error) pair per message, in order.
+        """
+        service = self.service()
+        results: List[Tuple[Optional[Dict[str, Any]], Optional[Exception]]] = [(None, None)] * len(bodies)
+
+        def on_response(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        def execute():
+            http = self.executor.http(credentials)
+            batch = service.new_batch_http_request(callback=on_response)
+            for index, body in enumerate(bodies):
+                request = service.users().messages().send(userId="me", body=body)
+                # Each part is serialized with its own request's credentials
+                request.http = http
+                batch.add(request, request_id=str(index))
+            batch.execute(http=http)
+
+        await self.executor.run(execute)
+        return results
+
+    async def refresh(self, credentials: Any):
+        """
+        Refresh an expired access token in place
+        """
+        from google.auth.transport.requests import Request
+
+        await self.executor.run(credentials.refresh, Request())
+
+    async def profile_email(self, credentials: Any) -> str:
+        """
+        Email address of the account, from cache or a single getProfile call
+        """
+        key = credentials_key(credentials)
+        email = self._profiles.get(key)
+        if email is not None:
+            self.stats["profile_hits"] += 1
+            return email
+
+        async def lookup() -> str:
+            self.stats["profile_misses"] += 1
+            profile = await self.execute(credentials, lambda service: service.users().getProfile(userId="me"))
+            email = profile.get('emailAddress')
+            self._profiles.set(key, email)
+            return email
+
+        # A polling UI can ask several times before the first lookup returns
+        return await self._profile_lookups.do(key, lookup)
+
+    def forget(self, credentials: Any):
+        """
+        Drop everything cached for a user, e.g. on logout
+        """
+        self._profiles.pop(credentials_key(credentials))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "service_built": self._service is not None,
+            **self.stats,
+            "executor": self.executor.snapshot(),
+        }
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+# Process-wide manager used by the auth and email routes
+manager = GmailClientManager()
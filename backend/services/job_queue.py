@@ -0,0 +1,404 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# SQLite file holding job state; shared by every worker process on the host
+JOBS_DB = os.getenv("JOBS_DB", ".cache/jobs.sqlite3")
+
+# Jobs run at once by each process
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+
+# Seconds a running job stays owned by its worker without a heartbeat; after that
+# another worker may pick it up (e.g. the first one crashed or was restarted)
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "60"))
+
+# Times a job is started before it is given up on
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+# Seconds finished jobs and their results are kept
+JOBS_RESULT_TTL = int(os.getenv("JOBS_RESULT_TTL", "86400"))
+
+# Seconds between checks for new work when idle (submissions in this process wake workers at once)
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+
+# Attempts at a heartbeat or finish write while another process holds the database's write lock
+_WRITE_ATTEMPTS = 5
+
+# Longest pause of a worker after an unexpected error, in seconds
+_MAX_BACKOFF = 30.0
+
+logger = logging.getLogger(__name__)
+
+# A handler gets the job's params and a callback for progress updates, and returns the result
+Handler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Awaitable[Any]]
+
+_COLUMNS = (
+    "id", "kind", "status", "params", "progress", "result", "error", "attempts",
+    "cancel_requested", "created_at", "started_at", "finished_at",
+)
+
+
+def dedup_key(kind: str, params: Dict[str, Any]) -> str:
+    """
+    Identical submissions of the same kind share a key
+    """
+    return hashlib.sha256(f"{kind}:{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+
+
+class JobQueue:
+    """
+    Persistent job queue: job state lives in SQLite, a pool of asyncio workers runs jobs.
+
+    Running jobs hold a lease renewed by heartbeat, so jobs orphaned by a crashed or
+    restarted worker are picked up again. Submitting a job identical to one that is
+    still queued or running returns the existing job instead of a new one.
+    """
+
+    def __init__(
+        self,
+        path: str = JOBS_DB,
+        workers: int = JOBS_WORKERS,
+        lease: float = JOBS_LEASE,
+        max_attempts: int = JOBS_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.workers = workers
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, Handler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_purge = 0.0
+        self.stats = {"submitted": 0, "deduplicated": 0, "completed": 0, "failed": 0, "cancelled": 0, "reclaimed": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Autocommit mode; claims use explicit BEGIN IMMEDIATE so only one worker wins
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT NOT NULL, "
+                "status TEXT NOT NULL, params TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedup ON jobs (dedup_key, status)")
+            self._conn = conn
+        return self._conn
+
+    def _row(self, row: Optional[tuple]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(zip(_COLUMNS, row))
+        for column in ("params", "progress", "result"):
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    # Blocking SQLite operations; the async API runs them in a thread
+
+    def _submit(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        key = dedup_key(kind, params)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE dedup_key = ? "
+                    "AND status IN ('queued', 'running') AND cancel_requested = 0 ORDER BY created_at LIMIT 1",
+                    (key,),
+                ).fetchone()
+                if row is not None:
+                    db.execute("COMMIT")
+                    self.stats["deduplicated"] += 1
+                    return {**self._row(row), "deduplicated": True}
+
+                job_id = uuid.uuid4().hex
+                db.execute(
+                    "INSERT INTO jobs (id, kind, dedup_key, status, params, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, kind, key, json.dumps(params), time.time()),
+                )
+                row = db.execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        self.stats["submitted"] += 1
+        return {**self._row(row), "deduplicated": False}
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        kinds = list(self._handlers)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    row = db.execute(
+                        f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE kind IN ({', '.join('?' * len(kinds))}) "
+                        "AND (status = 'queued' OR (status = 'running' AND lease_until < ?)) "
+                        "ORDER BY created_at LIMIT 1",
+                        (*kinds, now),
+                    ).fetchone()
+                    if row is None:
+                        db.execute("COMMIT")
+                        return None
+                    job = self._row(row)
+                    if job["status"] == "running":
+                        self.stats["reclaimed"] += 1
+                    if not job["cancel_requested"] and job["attempts"] < self.max_attempts:
+                        break
+
+                    # Orphaned while being cancelled, or it keeps killing its workers
+                    status = "cancelled" if job["cancel_requested"] else "failed"
+                    error = None if job["cancel_requested"] else f"Gave up after {job['attempts']} attempts"
+                    db.execute(
+                        "UPDATE jobs SET status = ?, error = ?, worker = NULL, finished_at = ? WHERE id = ?",
+                        (status, error, now, job["id"]),
+                    )
+                    self.stats[status] += 1
+
+                db.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                    "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (self.worker_id, now + self.lease, now, job["id"]),
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        job["attempts"] += 1
+        job["status"] = "running"
+        return job
+
+    def _heartbeat(self, job_id: str, progress: Optional[Dict[str, Any]]) -> bool:
+        """
+        Renew the lease and save progress; returns whether cancellation was requested
+        """
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "UPDATE jobs SET lease_until = ?, progress = COALESCE(?, progress) WHERE id = ? AND worker = ?",
+                (time.time() + self.lease, json.dumps(progress) if progress is not None else None, job_id, self.worker_id),
+            )
+            row = db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+                progress: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            # Only the worker holding the job may finish it; a reclaimed job belongs to someone else
+            self._db().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, progress = COALESCE(?, progress), "
+                "worker = NULL, lease_until = NULL, finished_at = ? WHERE id = ? AND worker = ?",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    json.dumps(progress) if progress is not None else None,
+                    time.time(),
+                    job_id,
+                    self.worker_id,
+                ),
+            )
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db().execute(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def _cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            # Queued jobs are cancelled outright; running ones are flagged for their worker
+            db.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return self._get(job_id)
+
+    def _release(self):
+        """
+        Put this worker's unfinished jobs back in the queue, without counting the interrupted attempt
+        """
+        with self._lock:
+            self._db().execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+                "WHERE worker = ? AND status = 'running'",
+                (self.worker_id,),
+            )
+
+    def _purge(self):
+        with self._lock:
+            self._db().execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND finished_at < ?",
+                (time.time() - JOBS_RESULT_TTL,),
+            )
+
+    def _counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    # Async API
+
+    async def submit(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a job, or return the identical job already queued or running
+        """
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            await asyncio.to_thread(self._purge)
+        job = await asyncio.to_thread(self._submit, kind, params)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job; a job running in this process stops immediately, elsewhere at its next heartbeat
+        """
+        job = await asyncio.to_thread(self._cancel, job_id)
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        return job
+
+    async def _write(self, operation: Callable[..., Any], *args) -> Any:
+        """
+        Run a blocking write in a thread, retrying with backoff while another process holds the write lock
+        """
+        for attempt in range(_WRITE_ATTEMPTS):
+            try:
+                return await asyncio.to_thread(operation, *args)
+            except sqlite3.OperationalError:
+                if attempt == _WRITE_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(0.1 * 2 ** attempt)
+
+    async def _settle(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+                      progress: Optional[Dict[str, Any]] = None):
+        try:
+            await self._write(self._finish, job_id, status, result, error, progress)
+        except sqlite3.OperationalError:
+            # The job stays running until its lease expires, then another worker runs it again
+            logger.exception("Could not record job %s as %s", job_id, status)
+        self.stats[status] += 1
+
+    async def _execute(self, job: Dict[str, Any]):
+        progress: Dict[str, Any] = {}
+
+        def report(update: Dict[str, Any]):
+            progress.update(update)
+
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            await self._settle(job["id"], "failed", error=f"No handler for job kind {job['kind']!r}")
+            return
+        task = asyncio.create_task(handler(job["params"], report))
+        self._running[job["id"]] = task
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=min(self.lease / 3, 5.0))
+                if done:
+                    break
+                try:
+                    cancel = await self._write(self._heartbeat, job["id"], progress or None)
+                except sqlite3.OperationalError:
+                    # Try again at the next beat; the lease outlasts a few missed ones
+                    logger.warning("Heartbeat for job %s failed; database busy", job["id"])
+                    continue
+                if cancel:
+                    task.cancel()
+
+            try:
+                result = task.result()
+            except asyncio.CancelledError:
+                await self._settle(job["id"], "cancelled", progress=progress or None)
+            except Exception as e:
+                await self._settle(job["id"], "failed", error=str(e), progress=progress or None)
+            else:
+                await self._settle(job["id"], "completed", result, progress=progress or None)
+        finally:
+            if not task.done():
+                task.cancel()
+            self._running.pop(job["id"], None)
+
+    async def _worker(self):
+        failures = 0
+        while True:
+            try:
+                try:
+                    job = await asyncio.to_thread(self._claim)
+                except sqlite3.OperationalError:
+                    # Database busy with another process's claim
+                    job = None
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=JOBS_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._execute(job)
+                failures = 0
+            except Exception:
+                # Keep the worker alive; a job left running is picked up again once its lease expires
+                failures += 1
+                logger.exception("Job worker error")
+                await asyncio.sleep(min(_MAX_BACKOFF, JOBS_POLL_INTERVAL * 2 ** (failures - 1)))
+
+    def start(self, handlers: Dict[str, Handler]):
+        """
+        Register job handlers by kind and start the worker pool
+        """
+        self._handlers.update(handlers)
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._conn is not None:
+            # Interrupted jobs go straight back to the queue instead of waiting out their lease
+            await asyncio.to_thread(self._release)
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    async def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker_id": self.worker_id,
+            "workers": self.workers,
+            "running_here": len(self._running),
+            "jobs": await asyncio.to_thread(self._counts),
+            **self.stats,
+        }
+
+
+# Process-wide queue used by the jobs routes
+queue = JobQueue()
@@ -0,0 +1,108 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional
+
+from services.context_packer import estimate_tokens, split_passages
+from services.fetcher import run_bounded
+
+# Tokens of source text per map call
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", "3000"))
+
+# Map calls in flight at once
+MAP_REDUCE_FAN_OUT = int(os.getenv("MAP_REDUCE_FAN_OUT", "4"))
+
+# Seconds allowed for the whole map phase; unfinished chunks are left out of the reduce step
+MAP_REDUCE_BUDGET = float(os.getenv("MAP_REDUCE_BUDGET", "40"))
+
+# Map outputs meaning "nothing relevant in this chunk"
+NOTHING_RELEVANT = "NONE"
+
+
+@dataclass
+class MapResult:
+    summaries: List[str]
+    chunks: int
+    summarized: int
+    failed: int
+
+
+def chunk_content(content: str, chunk_tokens: int = MAP_REDUCE_CHUNK_TOKENS) -> List[str]:
+    """
+    Group consecutive passages into chunks of about `chunk_tokens` tokens, keeping their sources
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    used = 0
+    for passage in split_passages(content):
+        block = f"Source: {passage.source or 'provided content'}\n{passage.text}"
+        cost = estimate_tokens(block)
+        if current and used + cost > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(block)
+        used += cost
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def map_messages(prompt: str, chunk: str) -> List[dict]:
+    """
+    Chat messages asking the model to pull the facts relevant to the query out of one chunk
+    """
+    return [
+        {
+            "role": "system",
+            "content": "You extract facts from web excerpts for a research assistant. "
+                       "Be brief and factual and never add information that is not in the excerpt.",
+        },
+        {
+            "role": "user",
+            "content": f"User Query: {prompt}\n\nExcerpt:\n{chunk}\n\n"
+                       "List the facts from the excerpt that help answer the query, noting the Source "
+                       f"URL of each. If nothing in the excerpt is relevant, reply with {NOTHING_RELEVANT} only.",
+        },
+    ]
+
+
+async def map_phase(
+    prompt: str,
+    content: str,
+    summarize: Callable[[List[dict]], Awaitable[str]],
+    chunk_tokens: int = MAP_REDUCE_CHUNK_TOKENS,
+    fan_out: int = MAP_REDUCE_FAN_OUT,
+    budget: Optional[float] = MAP_REDUCE_BUDGET,
+) -> MapResult:
+    """
+    Summarize every chunk concurrently, at most `fan_out` at a time, within `budget` seconds.
+
+    Summaries come back in chunk order so the reduce step reads sources in their original order.
+    """
+    chunks = chunk_content(content, chunk_tokens)
+    semaphore = asyncio.Semaphore(fan_out)
+    failed = 0
+
+    async def worker(index: int) -> Optional[str]:
+        nonlocal failed
+        async with semaphore:
+            try:
+                return await summarize(map_messages(prompt, chunks[index]))
+            except Exception:
+                failed += 1
+                return None
+
+    results = {}
+    async for index, summary in run_bounded(range(len(chunks)), worker, deadline=budget):
+        results[index] = summary
+
+    summaries = [
+        results[index].strip() for index in sorted(results)
+        if results[index] and results[index].strip().upper() != NOTHING_RELEVANT
+    ]
+    return MapResult(
+        summaries=summaries,
+        chunks=len(chunks),
+        summarized=sum(1 for summary in results.values() if summary is not None),
+        failed=failed,
+    )
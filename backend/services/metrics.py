@@ -0,0 +1,193 @@
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Where to write one JSON line per timed stage: empty disables it, "stderr", or a file path
+METRICS_TIMING_LOG = os.getenv("METRICS_TIMING_LOG", "")
+
+# Directory shared by worker processes for Prometheus multiprocess mode (set for gunicorn/uvicorn --workers)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+# Upstream calls range from a few milliseconds (cache hits) to a minute (map-reduce generations)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to finish an HTTP response, including streamed bodies",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being handled", ["method", "route"], multiprocess_mode="livesum"
+)
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Time spent in one stage of a request (upstream call, fetch, render, parse)",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter("stage_errors_total", "Stages that ended in an error", ["stage"])
+LLM_TOKENS = Counter("groq_tokens_total", "Tokens used by Groq completions", ["kind"])
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "upstream_queue_depth", "Calls waiting for an upstream slot", ["upstream"], multiprocess_mode="livesum"
+)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "upstream_concurrency_limit", "Adaptive concurrency limit per upstream", ["upstream"], multiprocess_mode="livemax"
+)
+
+# Id of the request being handled, attached to timing log lines
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+_timing_log = logging.getLogger("timing")
+
+
+def _configure_timing_log():
+    if not METRICS_TIMING_LOG or _timing_log.handlers:
+        return
+    if METRICS_TIMING_LOG == "stderr":
+        handler: logging.Handler = logging.StreamHandler(sys.stderr)
+    else:
+        os.makedirs(os.path.dirname(METRICS_TIMING_LOG) or ".", exist_ok=True)
+        handler = logging.FileHandler(METRICS_TIMING_LOG)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _timing_log.addHandler(handler)
+    _timing_log.setLevel(logging.INFO)
+    _timing_log.propagate = False
+
+
+_configure_timing_log()
+
+
+def log_timing(kind: str, name: str, seconds: float, **fields: Any):
+    if not _timing_log.handlers:
+        return
+    _timing_log.info(json.dumps({
+        "ts": time.time(),
+        "kind": kind,
+        "name": name,
+        "duration_ms": round(seconds * 1000, 2),
+        "request_id": request_id.get(),
+        **fields,
+    }, default=str))
+
+
+def observe(stage: str, seconds: float, ok: bool = True, **fields: Any):
+    """
+    Record a stage timed elsewhere, e.g. a fetch that measures itself
+    """
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    if not ok:
+        STAGE_ERRORS.labels(stage).inc()
+    log_timing("stage", stage, seconds, ok=ok, **fields)
+
+
+class Span:
+    def __init__(self, stage: str, fields: Dict[str, Any]):
+        self.stage = stage
+        self.fields = fields
+        self.seconds = 0.0
+
+    def set(self, **fields: Any):
+        """
+        Attach details to the timing log line, e.g. token counts known only at the end
+        """
+        self.fields.update(fields)
+
+
+@contextmanager
+def span(stage: str, **fields: Any) -> Iterator[Span]:
+    """
+    Time a block of work as one stage; exceptions are counted as errors and re-raised
+    """
+    current = Span(stage, fields)
+    started = time.perf_counter()
+    ok = True
+    try:
+        yield current
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        observe(stage, current.seconds, ok, **current.fields)
+
+
+def record_tokens(usage: Dict[str, Any]):
+    """
+    Count prompt and completion tokens from an OpenAI-style usage block
+    """
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(kind).inc(tokens)
+
+
+class MetricsMiddleware:
+    """
+    Per-route request counts, latency histograms and in-flight gauges.
+
+    Routes are labelled by their path template (/api/jobs/{job_id}), never by the raw path,
+    so label cardinality stays bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _route(self, scope: Scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+        token = request_id.set(uuid.uuid4().hex[:16])
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            REQUEST_COUNT.labels(method, route, str(status)).inc()
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            log_timing("request", route, elapsed, method=method, status=status)
+            request_id.reset(token)
+
+
+def metrics_response() -> Response:
+    """
+    Prometheus text exposition of every metric, merged across workers in multiprocess mode
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
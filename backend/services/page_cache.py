@@ -0,0 +1,434 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+PAGE_CACHE_DIR = os.getenv("PAGE_CACHE_DIR", ".cache/pages")
+
+# Disk budget for stored bodies and extracted text; least recently used entries go first
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Freshness lifetime for responses that don't state their own
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "3600"))
+
+# Upper bound on any server-provided lifetime
+PAGE_CACHE_MAX_TTL = int(os.getenv("PAGE_CACHE_MAX_TTL", str(7 * 24 * 3600)))
+
+# Query parameters that only track the visitor and never change the page
+_TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref_src)$', re.IGNORECASE)
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonicalise a URL so trivially different spellings share one cache entry
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(key)
+    ))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def _lifetime(headers: Dict[str, str], default_ttl: int) -> Optional[int]:
+    """
+    Seconds a response may be served without revalidation; None means don't store it
+    """
+    headers = {key.lower(): value for key, value in headers.items()}
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    if match:
+        return min(int(match.group(1)), PAGE_CACHE_MAX_TTL)
+    if "expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+            return int(min(max(0, expires - time.time()), PAGE_CACHE_MAX_TTL))
+        except (TypeError, ValueError):
+            pass
+    return default_ttl
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    body_hash: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+@dataclass
+class CachedPage:
+    entry: CacheEntry
+    text: str
+
+
+class PageCache:
+    """
+    Persistent cache of fetched pages and their extracted text, shared by every worker on the host.
+
+    Entries are keyed by the hash of the normalised URL. Bodies and extracted text
+    are stored content-addressed by the hash of the body, so mirrors and unchanged
+    re-downloads share storage and never need extracting twice. The entries, blob sizes
+    and access times live in a SQLite index, so the byte budget covers all workers
+    together and a blob is only deleted once no entry refers to it. A blob that is
+    missing anyway (e.g. removed by hand) makes its entry a miss.
+    """
+
+    def __init__(
+        self,
+        directory: str = PAGE_CACHE_DIR,
+        max_bytes: int = PAGE_CACHE_MAX_BYTES,
+        default_ttl: int = PAGE_CACHE_TTL,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries_dir = os.path.join(directory, "entries")
+        self._blobs_dir = os.path.join(directory, "blobs")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "stored": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+    def _blob_path(self, body_hash: str, kind: str) -> str:
+        return os.path.join(self._blobs_dir, f"{body_hash}.{kind}")
+
+    # Blocking disk and SQLite operations; the async API runs them in a thread
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self._blobs_dir, exist_ok=True)
+            # Autocommit mode; changes to entries and blobs use explicit BEGIN IMMEDIATE
+            conn = sqlite3.connect(
+                os.path.join(self.directory, "index.sqlite3"), check_same_thread=False, timeout=10, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, url TEXT NOT NULL, body_hash TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "fetched_at REAL NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_body_hash ON entries (body_hash)")
+            conn.execute("CREATE TABLE IF NOT EXISTS blobs (body_hash TEXT PRIMARY KEY, size INTEGER NOT NULL)")
+            self._conn = conn
+            self._import_entry_files()
+        return self._conn
+
+    def _import_entry_files(self):
+        """
+        Move entries kept as one JSON file each (by earlier versions) into the index
+        """
+        if not os.path.isdir(self._entries_dir):
+            return
+        for name in os.listdir(self._entries_dir):
+            path = os.path.join(self._entries_dir, name)
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+                accessed_at = data.pop("accessed_at", data["fetched_at"])
+                entry = CacheEntry(**data)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (body_hash, size) VALUES (?, ?)",
+                    (entry.body_hash, self._disk_size(entry.body_hash)),
+                )
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name[:-5], entry.url, entry.body_hash, entry.etag, entry.last_modified,
+                     entry.fetched_at, entry.expires_at, accessed_at),
+                )
+            except (OSError, ValueError, TypeError, KeyError):
+                pass
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(self._entries_dir)
+        except OSError:
+            pass
+
+    def _disk_size(self, body_hash: str) -> int:
+        size = 0
+        for kind in ("html", "txt"):
+            try:
+                size += os.path.getsize(self._blob_path(body_hash, kind))
+            except OSError:
+                pass
+        return size
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _write_blobs(self, body_hash: str, body: str, text: str) -> int:
+        body_bytes, text_bytes = body.encode("utf-8"), text.encode("utf-8")
+        self._write_atomic(self._blob_path(body_hash, "html"), body_bytes)
+        self._write_atomic(self._blob_path(body_hash, "txt"), text_bytes)
+        return len(body_bytes) + len(text_bytes)
+
+    def _has_blobs(self, body_hash: str) -> bool:
+        return all(os.path.exists(self._blob_path(body_hash, kind)) for kind in ("html", "txt"))
+
+    def _read_text(self, body_hash: str) -> Optional[str]:
+        try:
+            with open(self._blob_path(body_hash, "txt"), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _remove_blobs(self, body_hashes: List[str]):
+        for body_hash in body_hashes:
+            for kind in ("html", "txt"):
+                try:
+                    os.remove(self._blob_path(body_hash, kind))
+                except OSError:
+                    pass
+
+    def _unlink(self, db: sqlite3.Connection, key: str, body_hash: str) -> Optional[str]:
+        """
+        Delete an entry inside a transaction; returns its body hash if no entry uses the blob any more
+        """
+        db.execute("DELETE FROM entries WHERE key = ? AND body_hash = ?", (key, body_hash))
+        if db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)).fetchone():
+            return None
+        db.execute("DELETE FROM blobs WHERE body_hash = ?", (body_hash,))
+        return body_hash
+
+    def _write(self, change: Callable[[sqlite3.Connection], List[str]]):
+        """
+        Run `change` in a write transaction and remove the blobs it orphaned before committing.
+
+        Blob files are only written or removed while holding the index's write lock, so no
+        worker can remove a blob that another one has just checked or written.
+        """
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove_blobs(change(db))
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def _get(self, key: str) -> Optional[CachedPage]:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT url, body_hash, etag, last_modified, fetched_at, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        text = self._read_text(entry.body_hash)
+        if text is None:
+            # The blob is gone; drop the entry so the page is fetched and stored again
+            def drop(db: sqlite3.Connection) -> List[str]:
+                orphan = self._unlink(db, key, entry.body_hash)
+                return [orphan] if orphan else []
+
+            self._write(drop)
+            return None
+        with self._lock:
+            self._db().execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CachedPage(entry=entry, text=text)
+
+    def _text_for_body(self, body_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._db().execute("SELECT 1 FROM blobs WHERE body_hash = ?", (body_hash,)).fetchone()
+        return self._read_text(body_hash) if row else None
+
+    def _put(self, key: str, entry: CacheEntry, body: str, text: str):
+        # Write new blobs before taking the write lock; the check is repeated inside it
+        with self._lock:
+            row = self._db().execute("SELECT size FROM blobs WHERE body_hash = ?", (entry.body_hash,)).fetchone()
+        if row is not None and self._has_blobs(entry.body_hash):
+            size = row[0]
+        else:
+            size = self._write_blobs(entry.body_hash, body, text)
+
+        def change(db: sqlite3.Connection) -> List[str]:
+            nonlocal size
+            if not self._has_blobs(entry.body_hash):
+                # Another worker evicted the blob since the check above
+                size = self._write_blobs(entry.body_hash, body, text)
+            orphans = []
+            previous = db.execute("SELECT body_hash FROM entries WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, entry.url, entry.body_hash, entry.etag, entry.last_modified,
+                 entry.fetched_at, entry.expires_at, time.time()),
+            )
+            db.execute("INSERT OR IGNORE INTO blobs (body_hash, size) VALUES (?, ?)", (entry.body_hash, size))
+            if previous is not None and previous[0] != entry.body_hash:
+                if not db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", previous).fetchone():
+                    db.execute("DELETE FROM blobs WHERE body_hash = ?", previous)
+                    orphans.append(previous[0])
+
+            # Least recently used entries go until the blobs fit the budget
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = db.execute("SELECT key, body_hash FROM entries ORDER BY accessed_at LIMIT 1").fetchone()
+                if oldest is None:
+                    break
+                self.stats["evictions"] += 1
+                orphan = self._unlink(db, *oldest)
+                if orphan:
+                    orphans.append(orphan)
+                    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            return orphans
+
+        self._write(change)
+
+    def _revalidated(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._db().execute(
+                "UPDATE entries SET etag = ?, last_modified = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                (entry.etag, entry.last_modified, entry.expires_at, time.time(), key),
+            )
+
+    # Public API
+
+    async def get(self, url: str) -> Optional[CachedPage]:
+        """
+        Look a URL up, fresh or stale; callers decide whether to revalidate
+        """
+        try:
+            return await asyncio.to_thread(self._get, self.key(url))
+        except sqlite3.OperationalError:
+            # Index busy for too long; fetch the page as if it weren't cached
+            return None
+
+    def conditional_headers(self, page: Optional[CachedPage]) -> Dict[str, str]:
+        """
+        Request headers that let the origin answer 304 Not Modified
+        """
+        headers = {}
+        if page is not None:
+            if page.entry.etag:
+                headers["If-None-Match"] = page.entry.etag
+            if page.entry.last_modified:
+                headers["If-Modified-Since"] = page.entry.last_modified
+        return headers
+
+    async def text_for_body(self, body: str) -> Optional[str]:
+        """
+        Extracted text for a body we already stored under another URL, if any
+        """
+        body_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        try:
+            return await asyncio.to_thread(self._text_for_body, body_hash)
+        except sqlite3.OperationalError:
+            return None
+
+    async def put(self, url: str, body: str, headers: Dict[str, str], text: str):
+        """
+        Store a freshly downloaded page and its extracted text
+        """
+        ttl = _lifetime(headers, self.default_ttl)
+        if ttl is None:
+            return
+        lowered = {key.lower(): value for key, value in headers.items()}
+        now = time.time()
+        entry = CacheEntry(
+            url=normalize_url(url),
+            body_hash=hashlib.sha256(body.encode("utf-8")).hexdigest(),
+            etag=lowered.get("etag"),
+            last_modified=lowered.get("last-modified"),
+            fetched_at=now,
+            expires_at=now + ttl,
+        )
+        try:
+            await asyncio.to_thread(self._put, self.key(url), entry, body, text)
+        except sqlite3.OperationalError:
+            # The page is still returned; it just isn't cached this time
+            return
+        self.stats["stored"] += 1
+
+    async def revalidated(self, page: CachedPage, headers: Dict[str, str]):
+        """
+        Extend an entry's lifetime after the origin answered 304 Not Modified
+        """
+        lowered = {key.lower(): value for key, value in headers.items()}
+        ttl = _lifetime(headers, self.default_ttl) or 0
+        entry = page.entry
+        entry.expires_at = time.time() + ttl
+        entry.etag = lowered.get("etag", entry.etag)
+        entry.last_modified = lowered.get("last-modified", entry.last_modified)
+        self.stats["revalidated"] += 1
+        try:
+            await asyncio.to_thread(self._revalidated, self.key(entry.url), entry)
+        except sqlite3.OperationalError:
+            pass
+
+    def record_hit(self):
+        self.stats["hits"] += 1
+
+    def record_miss(self):
+        self.stats["misses"] += 1
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        Entries and bytes across all workers; this worker's hit, store and eviction counts
+        """
+        with self._lock:
+            db = self._db()
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        return {
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Process-wide cache used by the scrape route
+cache = PageCache()
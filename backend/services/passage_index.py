@@ -0,0 +1,615 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.context_packer import BM25_B, BM25_K1, is_boilerplate, split_passages, tokenize
+
+# Directory holding the index segments and their manifest; shared by every worker on the host
+PASSAGE_INDEX_DIR = os.getenv("PASSAGE_INDEX_DIR", ".cache/index")
+
+# Passages buffered in memory before they are written out as a new segment
+PASSAGE_INDEX_FLUSH_PASSAGES = int(os.getenv("PASSAGE_INDEX_FLUSH_PASSAGES", "2000"))
+
+# Once there are more segments than this, that many of the smallest are merged into one
+PASSAGE_INDEX_MERGE_FACTOR = int(os.getenv("PASSAGE_INDEX_MERGE_FACTOR", "8"))
+
+# Term frequencies are stored as uint16
+_MAX_FREQ = np.iinfo(np.uint16).max
+
+# Postings copied at once when merging segments
+_MERGE_CHUNK = 1 << 22
+
+# Score a segment exhaustively (one slot per passage) once candidates exceed 1/8 of its passages
+_DENSE_FRACTION = 8
+
+
+def hash64(values: Sequence[str]) -> np.ndarray:
+    """
+    Stable 64-bit hashes (the same in every process), used for terms and passage texts
+    """
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little") for value in values),
+        dtype=np.uint64, count=len(values),
+    )
+
+
+@dataclass
+class IndexedPassage:
+    source: Optional[str]
+    text: str
+    tokens: List[str]
+    hash: int
+
+
+@dataclass
+class Hit:
+    source: Optional[str]
+    text: str
+    score: float
+    coverage: float  # Fraction of the query's terms found in the passage
+
+
+class Segment:
+    """
+    Immutable slice of the index, stored as flat arrays.
+
+    Term `terms[i]` (a 64-bit hash, sorted) has postings `docs[offsets[i]:offsets[i + 1]]`
+    with frequencies in `freqs`, passages in increasing order. Passage `d` is
+    `text[text_offsets[d]:text_offsets[d + 1]]` (UTF-8) from `source_urls[sources[d]]`,
+    `lengths[d]` tokens long. `hashes` holds the sorted text hashes of all passages so
+    re-scraped text is not indexed twice. On disk every array is an .npy file opened
+    memory-mapped, so segments cost page cache rather than process memory.
+    """
+
+    ARRAYS = ("terms", "offsets", "docs", "freqs", "lengths", "sources", "text_offsets", "text", "hashes")
+
+    def __init__(self, name: str, arrays: Dict[str, np.ndarray], source_urls: List[Optional[str]]):
+        self.name = name
+        self.terms = arrays["terms"]
+        self.offsets = arrays["offsets"]
+        self.docs = arrays["docs"]
+        self.freqs = arrays["freqs"]
+        self.lengths = arrays["lengths"]
+        self.sources = arrays["sources"]
+        self.text_offsets = arrays["text_offsets"]
+        self.text = arrays["text"]
+        self.hashes = arrays["hashes"]
+        self.source_urls = source_urls
+        self.passages = len(self.lengths)
+        self.tokens = int(self.lengths.sum())
+        self._norm: Tuple[float, Optional[np.ndarray]] = (0.0, None)
+
+    @classmethod
+    def build(cls, name: str, passages: List[IndexedPassage]) -> "Segment":
+        """
+        In-memory segment from tokenized passages
+        """
+        count = len(passages)
+        vocabulary: Dict[str, int] = {}
+        term_ids = np.fromiter(
+            (vocabulary.setdefault(token, len(vocabulary)) for passage in passages for token in passage.tokens),
+            dtype=np.int64,
+        )
+        lengths = np.fromiter((len(passage.tokens) for passage in passages), dtype=np.uint32, count=count)
+        doc_ids = np.repeat(np.arange(count, dtype=np.int64), lengths)
+
+        # Number terms in hash order, then one sort of (term, passage) pairs yields sorted postings with counts
+        hashes = hash64(list(vocabulary))
+        order = np.argsort(hashes, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        pairs, freqs = np.unique(rank[term_ids] * count + doc_ids, return_counts=True)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs // count, minlength=len(vocabulary)), out=offsets[1:])
+
+        source_urls = list(dict.fromkeys(passage.source for passage in passages))
+        source_index = {url: index for index, url in enumerate(source_urls)}
+        encoded = [passage.text.encode("utf-8") for passage in passages]
+        text_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=text_offsets[1:])
+
+        return cls(name, {
+            "terms": hashes[order],
+            "offsets": offsets,
+            "docs": (pairs % count).astype(np.uint32),
+            "freqs": np.minimum(freqs, _MAX_FREQ).astype(np.uint16),
+            "lengths": lengths,
+            "sources": np.fromiter((source_index[passage.source] for passage in passages), dtype=np.uint32, count=count),
+            "text_offsets": text_offsets,
+            "text": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "hashes": np.sort(np.fromiter((passage.hash for passage in passages), dtype=np.uint64, count=count)),
+        }, source_urls)
+
+    @classmethod
+    def merge(cls, directory: str, segments: List["Segment"]) -> None:
+        """
+        Write the union of `segments` to `directory` in one linear pass.
+
+        Each segment's terms are already sorted, so postings are copied straight to their
+        place in the merged arrays (written memory-mapped) instead of being re-sorted;
+        passages keep segment order, which keeps every posting list sorted.
+        """
+        terms = np.unique(np.concatenate([segment.terms for segment in segments]))
+        positions = [np.searchsorted(terms, segment.terms) for segment in segments]
+        counts = np.zeros(len(terms), dtype=np.int64)
+        for segment, position in zip(segments, positions):
+            counts[position] += np.diff(segment.offsets)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        postings = int(offsets[-1])
+        text_bytes = sum(len(segment.text) for segment in segments)
+        docs = _create(directory, "docs", postings, np.uint32)
+        freqs = _create(directory, "freqs", postings, np.uint16)
+        text = _create(directory, "text", text_bytes, np.uint8)
+
+        cursor = offsets[:-1].copy()
+        doc_base = text_base = 0
+        source_index: Dict[Optional[str], int] = {}
+        lengths, sources, text_offsets = [], [], []
+        for segment, position in zip(segments, positions):
+            sizes = np.diff(segment.offsets)
+            # Each posting moves by its term's offset in the merged list (plus earlier segments' postings)
+            shift = cursor[position] - segment.offsets[:-1]
+            start = 0
+            while start < len(segment.terms):
+                # Copy a bounded number of postings at a time so merging big segments needs little memory
+                end = int(np.searchsorted(segment.offsets, segment.offsets[start] + _MERGE_CHUNK, side="right")) - 1
+                end = min(max(end, start + 1), len(segment.terms))
+                low, high = segment.offsets[start], segment.offsets[end]
+                destination = np.repeat(shift[start:end], sizes[start:end]) + np.arange(low, high)
+                docs[destination] = segment.docs[low:high] + np.uint32(doc_base)
+                freqs[destination] = segment.freqs[low:high]
+                start = end
+            cursor[position] += sizes
+
+            text[text_base:text_base + len(segment.text)] = segment.text
+            text_offsets.append(segment.text_offsets[:-1] + text_base)
+            remap = np.array([source_index.setdefault(url, len(source_index)) for url in segment.source_urls], dtype=np.uint32)
+            sources.append(remap[segment.sources])
+            lengths.append(segment.lengths)
+            doc_base += segment.passages
+            text_base += len(segment.text)
+
+        for array in (docs, freqs, text):
+            array.flush()
+        _save(directory, {
+            "terms": terms,
+            "offsets": offsets,
+            "lengths": np.concatenate(lengths),
+            "sources": np.concatenate(sources),
+            "text_offsets": np.append(np.concatenate(text_offsets), text_base),
+            "hashes": np.sort(np.concatenate([segment.hashes for segment in segments])),
+        }, list(source_index))
+
+    def save(self, directory: str):
+        _save(directory, {key: getattr(self, key) for key in self.ARRAYS}, self.source_urls)
+
+    @classmethod
+    def open(cls, name: str, directory: str) -> "Segment":
+        arrays = {key: np.load(os.path.join(directory, f"{key}.npy"), mmap_mode="r") for key in cls.ARRAYS}
+        with open(os.path.join(directory, "sources.json")) as f:
+            source_urls = json.load(f)
+        return cls(name, arrays, source_urls)
+
+    def postings(self, term: np.uint64) -> Tuple[np.ndarray, np.ndarray]:
+        index = int(np.searchsorted(self.terms, term))
+        if index < len(self.terms) and self.terms[index] == term:
+            start, end = self.offsets[index], self.offsets[index + 1]
+            return self.docs[start:end], self.freqs[start:end]
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16)
+
+    def top(
+        self,
+        found: List[Tuple[np.ndarray, np.ndarray]],
+        idf: np.ndarray,
+        average_length: float,
+        k: int,
+        threshold: float = 0.0,
+    ) -> List[Tuple[float, int, int]]:
+        """
+        Best `k` (score, terms matched, passage) in this segment, given each query term's postings.
+
+        Pruned as in MaxScore: terms are taken rarest first, and once the k-th best score among
+        passages containing the rarer terms (or `threshold`, from other segments) reaches the most
+        the remaining common terms could add together, passages holding only common terms cannot
+        make the top `k` and are never scored. Common terms are then only looked up for the few
+        candidate passages instead of being scanned.
+        """
+        sizes = [len(docs) for docs, _ in found]
+        order = sorted(range(len(found)), key=sizes.__getitem__)
+        # A term contributes less than idf * (k1 + 1) whatever its frequency
+        upper = idf * (BM25_K1 + 1)
+        for split in range(1, len(order) + 1):
+            essential = order[:split]
+            candidates = sum(sizes[term] for term in essential)
+            if not candidates:
+                continue
+            if split > 1 and candidates * _DENSE_FRACTION > self.passages:
+                return self._top_dense(found, idf, average_length, k)
+
+            # Posting lists are sorted and duplicate-free, so a single list needs no union
+            docs = found[order[0]][0] if split == 1 else np.unique(np.concatenate([found[term][0] for term in essential]))
+            norm = self.length_norm(average_length)[docs]
+            scores = np.zeros(len(docs))
+            matched = np.zeros(len(docs), dtype=np.int64)
+            for term, (term_docs, term_freqs) in enumerate(found):
+                if not len(term_docs):
+                    continue
+                if term_docs is docs:
+                    tf = term_freqs.astype(np.float64)
+                else:
+                    positions = np.minimum(np.searchsorted(term_docs, docs), len(term_docs) - 1)
+                    tf = np.where(term_docs[positions] == docs, term_freqs[positions], 0).astype(np.float64)
+                scores += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+                matched += tf > 0
+            top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+            kth = float(scores[top].min()) if len(top) >= k else 0.0
+            if split == len(order) or max(kth, threshold) >= upper[order[split:]].sum():
+                return [(float(scores[index]), int(matched[index]), int(docs[index])) for index in top]
+        return []
+
+    def _top_dense(
+        self, found: List[Tuple[np.ndarray, np.ndarray]], idf: np.ndarray, average_length: float, k: int
+    ) -> List[Tuple[float, int, int]]:
+        """
+        Exhaustive scoring into one array slot per passage, for queries whose terms cover much of the segment
+        """
+        norm = self.length_norm(average_length)
+        scores = np.zeros(self.passages, dtype=np.float32)
+        for term, (term_docs, term_freqs) in enumerate(found):
+            if len(term_docs):
+                tf = term_freqs.astype(np.float32)
+                # A passage appears once per posting list, so a plain indexed add is safe
+                scores[term_docs] += np.float32(idf[term] * (BM25_K1 + 1)) * tf / (tf + norm[term_docs])
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[scores[top] > 0]
+        matched = np.zeros(len(top), dtype=np.int64)
+        for term_docs, _ in found:
+            if len(term_docs):
+                matched += term_docs[np.minimum(np.searchsorted(term_docs, top), len(term_docs) - 1)] == top
+        return [(float(scores[index]), int(hits), int(index)) for index, hits in zip(top, matched)]
+
+    def length_norm(self, average_length: float) -> np.ndarray:
+        """
+        BM25 length normalisation of every passage, kept until the corpus' average length changes
+        """
+        cached_length, norm = self._norm
+        if norm is None or cached_length != average_length:
+            norm = (BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / average_length)).astype(np.float32)
+            self._norm = (average_length, norm)
+        return norm
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        positions = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return self.hashes[positions] == hashes
+
+    def passage(self, doc: int) -> Tuple[Optional[str], str]:
+        start, end = self.text_offsets[doc], self.text_offsets[doc + 1]
+        return self.source_urls[self.sources[doc]], self.text[start:end].tobytes().decode("utf-8")
+
+    @property
+    def bytes(self) -> int:
+        return sum(getattr(self, key).nbytes for key in self.ARRAYS)
+
+
+def _create(directory: str, key: str, size: int, dtype) -> np.ndarray:
+    return np.lib.format.open_memmap(os.path.join(directory, f"{key}.npy"), mode="w+", dtype=dtype, shape=(size,))
+
+
+def _save(directory: str, arrays: Dict[str, np.ndarray], source_urls: List[Optional[str]]):
+    for key, array in arrays.items():
+        np.save(os.path.join(directory, f"{key}.npy"), np.ascontiguousarray(array))
+    with open(os.path.join(directory, "sources.json"), "w") as f:
+        json.dump(source_urls, f)
+
+
+class PassageIndex:
+    """
+    Incremental BM25 index over scraped passages, persisted on disk.
+
+    New passages go to an in-memory buffer that is searchable at once and written out as
+    an immutable segment when it fills up; small segments are merged in the background so
+    a query touches only a handful. Which segments are live is recorded in a SQLite
+    manifest, so every worker process on the host searches the same corpus and picks up
+    segments written by the others.
+    """
+
+    def __init__(
+        self,
+        directory: str = PASSAGE_INDEX_DIR,
+        flush_passages: int = PASSAGE_INDEX_FLUSH_PASSAGES,
+        merge_factor: int = PASSAGE_INDEX_MERGE_FACTOR,
+    ):
+        self.directory = directory
+        self.flush_passages = flush_passages
+        self.merge_factor = max(2, merge_factor)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+        self._segments: Dict[str, Segment] = {}
+        self._buffer: List[IndexedPassage] = []
+        self._buffer_hashes: set = set()
+        self._buffer_segment: Optional[Segment] = None
+        self._pending: Optional[Segment] = None  # Buffer being written out, still searchable
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"pages": 0, "added": 0, "duplicates": 0, "queries": 0, "query_ms": 0.0, "flushes": 0, "merges": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.join(self.directory, "segments"), exist_ok=True)
+            self._conn = sqlite3.connect(
+                os.path.join(self.directory, "manifest.sqlite3"), check_same_thread=False, timeout=30, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments "
+                "(name TEXT PRIMARY KEY, passages INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _segment_dir(self, name: str) -> str:
+        return os.path.join(self.directory, "segments", name)
+
+    def _refresh(self):
+        """
+        Open segments other processes added and drop the ones they merged away
+        """
+        with self._lock:
+            conn = self._db()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return
+            names = [row[0] for row in conn.execute("SELECT name FROM segments ORDER BY created_at")]
+            segments = {}
+            for name in names:
+                try:
+                    segments[name] = self._segments.get(name) or Segment.open(name, self._segment_dir(name))
+                except FileNotFoundError:
+                    # Merged away between reading the manifest and opening it; the next refresh sees the result
+                    version = None
+            self._segments = segments
+            self._data_version = version
+
+    def _searchable(self, include_buffer: bool = True) -> List[Segment]:
+        self._refresh()
+        with self._lock:
+            if not include_buffer:
+                return list(self._segments.values()) + ([self._pending] if self._pending is not None else [])
+            if self._buffer and self._buffer_segment is None:
+                self._buffer_segment = Segment.build("buffer", self._buffer)
+            extra = [segment for segment in (self._pending, self._buffer_segment) if segment is not None]
+            return list(self._segments.values()) + extra
+
+    def add_page(self, source: Optional[str], text: str) -> int:
+        """
+        Split a page's extracted text into passages and index the new ones; returns how many were added
+        """
+        passages = [
+            (source, passage.text) for passage in split_passages(text)
+            if not is_boilerplate(passage)
+        ]
+        with self._lock:
+            self.stats["pages"] += 1
+        return self.add_passages(passages)
+
+    def add_passages(self, passages: Iterable[Tuple[Optional[str], str]]) -> int:
+        """
+        Index (source, text) passages, skipping any whose text is already indexed
+        """
+        items = []
+        for source, text in passages:
+            tokens = tokenize(text)
+            if tokens:
+                items.append(IndexedPassage(source, text, tokens, 0))
+        if not items:
+            return 0
+        hashes = hash64([item.text for item in items])
+        known = np.zeros(len(items), dtype=bool)
+        # The buffer itself is checked by hash below
+        for segment in self._searchable(include_buffer=False):
+            if segment.passages:
+                known |= segment.contains(hashes)
+
+        added = 0
+        with self._lock:
+            for item, text_hash, seen in zip(items, hashes.tolist(), known.tolist()):
+                if seen or text_hash in self._buffer_hashes:
+                    self.stats["duplicates"] += 1
+                    continue
+                item.hash = text_hash
+                self._buffer.append(item)
+                self._buffer_hashes.add(text_hash)
+                added += 1
+            self.stats["added"] += added
+            if added:
+                self._buffer_segment = None
+            full = len(self._buffer) >= self.flush_passages
+            if full and (self._flusher is None or not self._flusher.is_alive()):
+                # Write segments and merge off the caller's thread; the buffer stays searchable meanwhile
+                self._flusher = threading.Thread(
+                    target=self.flush, kwargs={"full_only": True}, name="passage-index-flush", daemon=True
+                )
+                self._flusher.start()
+        return added
+
+    def flush(self, full_only: bool = False):
+        """
+        Write buffered passages out as new segments, then merge small segments if there are too many.
+
+        With `full_only`, a partly filled buffer is left to fill up.
+        """
+        with self._write_lock:
+            while True:
+                with self._lock:
+                    if not self._buffer or (full_only and len(self._buffer) < self.flush_passages):
+                        break
+                    batch = self._buffer[:self.flush_passages]
+                    self._pending = (
+                        self._buffer_segment if len(batch) == len(self._buffer) and self._buffer_segment is not None
+                        else Segment.build("pending", batch)
+                    )
+                    del self._buffer[:len(batch)]
+                    self._buffer_hashes.difference_update(item.hash for item in batch)
+                    self._buffer_segment = None
+
+                name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+                temporary = self._segment_dir(f".{name}")
+                os.makedirs(temporary)
+                self._pending.save(temporary)
+                os.replace(temporary, self._segment_dir(name))
+                segment = Segment.open(name, self._segment_dir(name))
+                with self._lock:
+                    # Publish and swap in one step so no query sees these passages twice
+                    self._db().execute(
+                        "INSERT INTO segments (name, passages, created_at) VALUES (?, ?, ?)",
+                        (name, segment.passages, time.time()),
+                    )
+                    self._segments[name] = segment
+                    self._pending = None
+                    self.stats["flushes"] += 1
+            while self._merge():
+                pass
+
+    def _merge(self) -> bool:
+        """
+        Merge the smallest segments into one once there are too many; False when there was nothing to do
+        """
+        self._refresh()
+        with self._lock:
+            if len(self._segments) <= self.merge_factor:
+                return False
+            smallest = sorted(self._segments.values(), key=lambda segment: segment.passages)[:self.merge_factor]
+            # Keep the manifest's order so merged passages stay in insertion order
+            victims = [segment for segment in self._segments.values() if segment in smallest]
+
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        temporary = self._segment_dir(f".{name}")
+        os.makedirs(temporary)
+        Segment.merge(temporary, victims)
+        os.replace(temporary, self._segment_dir(name))
+        merged = Segment.open(name, self._segment_dir(name))
+
+        names = [segment.name for segment in victims]
+        # Under the lock, as _refresh reads the manifest on this same connection: it must not see
+        # the victims gone before the merged segment is in, and publish and swap happen in one step
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                live = conn.execute(
+                    f"SELECT COUNT(*) FROM segments WHERE name IN ({','.join('?' * len(names))})", names
+                ).fetchone()[0]
+                # Another process merged some of these first
+                raced = live != len(names)
+                if not raced:
+                    conn.executemany("DELETE FROM segments WHERE name = ?", [(name_,) for name_ in names])
+                    conn.execute(
+                        "INSERT INTO segments (name, passages, created_at) VALUES (?, ?, ?)",
+                        (name, merged.passages, time.time()),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not raced:
+                for victim in victims:
+                    self._segments.pop(victim.name, None)
+                self._segments[name] = merged
+                self.stats["merges"] += 1
+
+        if raced:
+            shutil.rmtree(self._segment_dir(name), ignore_errors=True)
+            return True
+        # Open memory maps (here or in other workers) keep their data until they are dropped
+        for victim in victims:
+            shutil.rmtree(self._segment_dir(victim.name), ignore_errors=True)
+        return True
+
+    def search(self, query: str, k: int = 10) -> List[Hit]:
+        """
+        Top `k` passages for the query by BM25 over the whole corpus
+        """
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        segments = [segment for segment in self._searchable() if segment.passages]
+        hits: List[Tuple[float, int, Segment, int]] = []
+        if terms and segments:
+            term_hashes = hash64(terms)
+            lists = [[segment.postings(term) for term in term_hashes] for segment in segments]
+
+            # Corpus-wide statistics, so scores are comparable across segments
+            passages = sum(segment.passages for segment in segments)
+            average_length = max(sum(segment.tokens for segment in segments) / passages, 1.0)
+            df = np.array([sum(len(found[index][0]) for found in lists) for index in range(len(terms))], dtype=np.float64)
+            idf = np.log1p((passages - df + 0.5) / (df + 0.5))
+
+            threshold = 0.0
+            for segment, found in zip(segments, lists):
+                hits.extend(
+                    (score, matched, segment, doc)
+                    for score, matched, doc in segment.top(found, idf, average_length, k, threshold)
+                )
+                if len(hits) >= k:
+                    # Later segments only need to beat the k-th best score so far
+                    threshold = sorted(hit[0] for hit in hits)[-k]
+
+        hits.sort(key=lambda hit: -hit[0])
+        results = []
+        for score, matched, segment, doc in hits[:k]:
+            source, text = segment.passage(doc)
+            results.append(Hit(source=source, text=text, score=score, coverage=matched / len(terms)))
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["query_ms"] += (time.perf_counter() - started) * 1000
+        return results
+
+    async def aadd_page(self, source: Optional[str], text: str) -> int:
+        return await asyncio.to_thread(self.add_page, source, text)
+
+    async def asearch(self, query: str, k: int = 10) -> List[Hit]:
+        return await asyncio.to_thread(self.search, query, k)
+
+    def close(self):
+        """
+        Write out whatever is still buffered
+        """
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._data_version = None
+
+    def snapshot(self) -> Dict:
+        self._refresh()
+        with self._lock:
+            segments = list(self._segments.values())
+            stats = dict(self.stats)
+            buffered = len(self._buffer) + (self._pending.passages if self._pending is not None else 0)
+        queries = stats.pop("queries")
+        query_ms = stats.pop("query_ms")
+        return {
+            "segments": len(segments),
+            "passages": sum(segment.passages for segment in segments) + buffered,
+            "buffered": buffered,
+            "postings": sum(len(segment.docs) for segment in segments),
+            "disk_bytes": sum(segment.bytes for segment in segments),
+            "queries": queries,
+            "mean_query_ms": round(query_ms / queries, 2) if queries else None,
+            **stats,
+        }
+
+
+index = PassageIndex()
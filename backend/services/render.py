@@ -0,0 +1,193 @@
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+# Number of warm browser contexts kept open
+RENDER_POOL_SIZE = int(os.getenv("RENDER_POOL_SIZE", "2"))
+
+# A context is closed and replaced after this many renders to bound memory growth
+RENDER_MAX_USES = int(os.getenv("RENDER_MAX_USES", "50"))
+
+# Seconds allowed for a single page render
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "20"))
+
+# Seconds to wait for a free context before giving up on rendering
+RENDER_ACQUIRE_TIMEOUT = float(os.getenv("RENDER_ACQUIRE_TIMEOUT", "10"))
+
+# Pages whose static text is shorter than this are candidates for rendering
+RENDER_MIN_TEXT_CHARS = int(os.getenv("RENDER_MIN_TEXT_CHARS", "500"))
+
+_SCRIPT_TAG = re.compile(r'<script\b', re.IGNORECASE)
+
+
+def needs_render(html: str, static_text: str) -> bool:
+    """
+    Decide whether a page should go through the headless browser.
+
+    Only pages that yield too little text statically and actually ship scripts
+    are rendered; anything else would come back the same.
+    """
+    if len(static_text) >= RENDER_MIN_TEXT_CHARS:
+        return False
+    return bool(_SCRIPT_TAG.search(html))
+
+
+@dataclass
+class _Slot:
+    # Both None for a placeholder whose context is opened by the next render
+    context: Any
+    page: Any
+    uses: int = 0
+    broken: bool = False
+
+
+class RenderPool:
+    """
+    A small pool of warm headless-browser contexts shared across requests
+    """
+
+    def __init__(
+        self,
+        size: int = RENDER_POOL_SIZE,
+        max_uses: int = RENDER_MAX_USES,
+        timeout: float = RENDER_TIMEOUT,
+        acquire_timeout: float = RENDER_ACQUIRE_TIMEOUT,
+    ):
+        self.size = size
+        self.max_uses = max_uses
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._browser = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self.stats = {
+            "decided_render": 0,
+            "decided_skip": 0,
+            "rendered": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "recycled": 0,
+        }
+
+    async def _new_slot(self) -> _Slot:
+        context = await self._browser.createIncognitoBrowserContext()
+        page = await context.newPage()
+        return _Slot(context=context, page=page)
+
+    async def _start(self):
+        # Launch lazily so processes that never render never start Chromium
+        async with self._start_lock:
+            if self._queue is not None:
+                return
+            from pyppeteer import launch
+
+            self._browser = await launch(
+                headless=True,
+                args=['--no-sandbox', '--disable-gpu', '--disable-dev-shm-usage'],
+                handleSIGINT=False,
+                handleSIGTERM=False,
+                handleSIGHUP=False,
+            )
+            queue = asyncio.Queue()
+            try:
+                for _ in range(self.size):
+                    queue.put_nowait(await self._new_slot())
+            except BaseException:
+                # Shut the browser down so the next render launches a fresh one instead of leaking this one
+                browser, self._browser = self._browser, None
+                while not queue.empty():
+                    try:
+                        await queue.get_nowait().context.close()
+                    except Exception:
+                        pass
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+                raise
+            # Publish the queue last; it doubles as the "pool is ready" flag
+            self._queue = queue
+
+    async def _recycle(self, slot: _Slot) -> _Slot:
+        self.stats["recycled"] += 1
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        return await self._new_slot()
+
+    def record_decision(self, render: bool):
+        self.stats["decided_render" if render else "decided_skip"] += 1
+
+    async def render(self, url: str) -> str:
+        """
+        Load a URL in a pooled context, run its scripts and return the resulting HTML
+        """
+        if self._queue is None:
+            await self._start()
+
+        queue = self._queue
+        slot = await asyncio.wait_for(queue.get(), timeout=self.acquire_timeout)
+        try:
+            if slot.context is None:
+                # A previous recycle failed; open the context it couldn't
+                slot = await self._new_slot()
+            slot.uses += 1
+            page = slot.page
+            await asyncio.wait_for(
+                page.goto(url, waitUntil='networkidle2', timeout=int(self.timeout * 1000)),
+                timeout=self.timeout,
+            )
+            html = await page.content()
+            self.stats["rendered"] += 1
+            return html
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            slot.broken = True
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            slot.broken = True
+            raise
+        except BaseException:
+            # Cancelled, possibly mid-navigation; the page can't be reused as it is
+            slot.broken = True
+            raise
+        finally:
+            # Hand the context back, replacing it when worn out or in a bad state
+            if slot.broken or slot.uses >= self.max_uses:
+                try:
+                    slot = await self._recycle(slot)
+                except Exception:
+                    # Keep the pool size stable even if the browser refuses a new context
+                    slot = _Slot(context=None, page=None)
+                except BaseException:
+                    queue.put_nowait(_Slot(context=None, page=None))
+                    raise
+            queue.put_nowait(slot)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.size,
+            "idle": self._queue.qsize() if self._queue is not None else 0,
+            "browser_running": self._browser is not None,
+            "max_uses": self.max_uses,
+            "min_text_chars": RENDER_MIN_TEXT_CHARS,
+            **self.stats,
+        }
+
+    async def close(self):
+        """
+        Shut the browser down
+        """
+        if self._browser is not None:
+            browser, self._browser = self._browser, None
+            self._queue = None
+            await browser.close()
+
+
+# Process-wide pool used by the scrape route
+pool = RenderPool()
@@ -0,0 +1,366 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from services import metrics
+
+# Priorities: lower runs first. Interactive requests jump ahead of background jobs.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Priority of upstream calls made by the current task; background job handlers lower it
+priority: contextvars.ContextVar[int] = contextvars.ContextVar("upstream_priority", default=PRIORITY_INTERACTIVE)
+
+# Responses worth retrying: rate limited, or the upstream is briefly unavailable
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds in a rate-limit reset header: "7.66s", "2m59.56s", "1h2m", "120ms" or a plain number
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    scale = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+
+
+@dataclass
+class _Budget:
+    """
+    One rate-limit window as reported by the upstream: limit, what is left, and when it resets
+    """
+    limit: Optional[int] = None
+    remaining: Optional[float] = None
+    reset_at: float = 0.0
+
+    def roll(self, now: float):
+        if now < self.reset_at:
+            return
+        if self.limit is not None:
+            # The window has reset; the next response's headers correct this estimate
+            self.remaining = self.limit
+            self.reset_at = now + 60.0
+        else:
+            self.remaining = None
+
+    def update(self, limit: Optional[str], remaining: Optional[str], reset: Optional[str], now: float):
+        if limit is not None:
+            self.limit = int(float(limit))
+        if remaining is not None:
+            self.remaining = float(remaining)
+            self.reset_at = now + (parse_duration(reset) or 60.0)
+
+
+class UpstreamScheduler:
+    """
+    Admission control for one rate-limited upstream.
+
+    Calls wait in a priority queue and are let through when three conditions hold:
+    - the concurrency limit has room; it is adapted AIMD-style, growing by about one per
+      round of successful calls and halving when the upstream answers 429
+    - the request and token budgets reported in the upstream's x-ratelimit-* response
+      headers cover the call
+    - no Retry-After pause is in force
+
+    Throttled and failed calls are retried after Retry-After, or with exponential backoff,
+    plus jitter so queued callers don't retry in lockstep.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_concurrency: float = 4,
+        min_concurrency: float = 1,
+        max_concurrency: float = 32,
+        max_retries: int = 4,
+        queue_timeout: float = 60.0,
+        requests_per_window: Optional[int] = None,
+        tokens_per_window: Optional[int] = None,
+    ):
+        self.name = name
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = float(min_concurrency)
+        self.max_concurrency = float(max_concurrency)
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.requests = _Budget(limit=requests_per_window, remaining=requests_per_window)
+        self.tokens = _Budget(limit=tokens_per_window, remaining=tokens_per_window)
+        self.in_flight = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._wakeup_at = 0.0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self.stats = {"dispatched": 0, "succeeded": 0, "throttled": 0, "failed": 0, "retries": 0, "queue_timeouts": 0}
+
+    # Admission
+
+    def _blocked_until(self, tokens: int, now: float) -> Optional[float]:
+        """
+        None if a call needing `tokens` may start now, else when to look again (0 = when a slot frees)
+        """
+        if now < self._paused_until:
+            return self._paused_until
+        if self.in_flight >= max(self.min_concurrency, int(self.limit)):
+            return 0.0
+        self.requests.roll(now)
+        self.tokens.roll(now)
+        if self.requests.remaining is not None and self.requests.remaining < 1:
+            return self.requests.reset_at
+        if self.tokens.remaining is not None and tokens > self.tokens.remaining:
+            # A call larger than a whole window can only ever run on a fresh window
+            fresh = self.tokens.limit is not None and self.tokens.remaining >= self.tokens.limit
+            if not fresh:
+                return self.tokens.reset_at
+        return None
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.future.done():
+                # Timed out or cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            retry_at = self._blocked_until(waiter.tokens, now)
+            if retry_at is not None:
+                if retry_at > now:
+                    self._wake_at(loop, retry_at)
+                break
+            heapq.heappop(self._queue)
+            self.in_flight += 1
+            if self.requests.remaining is not None:
+                self.requests.remaining -= 1
+            if self.tokens.remaining is not None:
+                self.tokens.remaining -= waiter.tokens
+            self.stats["dispatched"] += 1
+            self._waits.append(now - waiter.enqueued)
+            metrics.observe(f"{self.name}.queue_wait", now - waiter.enqueued)
+            waiter.future.set_result(None)
+        metrics.UPSTREAM_QUEUE_DEPTH.labels(self.name).set(len(self._queue))
+        metrics.UPSTREAM_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+    def _wake_at(self, loop: asyncio.AbstractEventLoop, when: float):
+        if self._wakeup is not None and time.monotonic() < self._wakeup_at <= when:
+            # An earlier wake-up is already pending
+            return
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup_at = when
+        self._wakeup = loop.call_later(max(0.0, when - time.monotonic()), self._pump)
+
+    async def _acquire(self, tokens: int, call_priority: int):
+        waiter = _Waiter(call_priority, next(self._seq), tokens, asyncio.get_running_loop().create_future(), time.monotonic())
+        heapq.heappush(self._queue, waiter)
+        self._pump()
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["queue_timeouts"] += 1
+            raise UpstreamBusy(self.name, self.queue_timeout)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted a slot just as the caller gave up
+                self._release("cancelled")
+            raise
+
+    def _release(self, outcome: str):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome == "ok":
+            self.stats["succeeded"] += 1
+            # Additive increase: about +1 per limit's worth of successful calls
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        elif outcome == "throttled":
+            self.stats["throttled"] += 1
+            # Multiplicative decrease, at most once per second so one burst of 429s halves once
+            if now - self._last_decrease > 1.0:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self._last_decrease = now
+        elif outcome == "error":
+            self.stats["failed"] += 1
+        self._pump()
+
+    # Responses
+
+    def _observe(self, response: httpx.Response):
+        headers = response.headers
+        now = time.monotonic()
+        self.requests.update(
+            headers.get("x-ratelimit-limit-requests"),
+            headers.get("x-ratelimit-remaining-requests"),
+            headers.get("x-ratelimit-reset-requests"),
+            now,
+        )
+        self.tokens.update(
+            headers.get("x-ratelimit-limit-tokens"),
+            headers.get("x-ratelimit-remaining-tokens"),
+            headers.get("x-ratelimit-reset-tokens"),
+            now,
+        )
+
+    def _retry_delay(self, response: Optional[httpx.Response], attempt: int) -> float:
+        retry_after = parse_duration(response.headers.get("retry-after")) if response is not None else None
+        if retry_after is not None:
+            # Never earlier than asked; a little later so waiting callers spread out
+            delay = retry_after * random.uniform(1.0, 1.2)
+            if response.status_code == 429:
+                # The quota is shared: hold every queued call, not just this one
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            return delay
+        return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    @staticmethod
+    def _outcome(status: int) -> str:
+        if status == 429:
+            return "throttled"
+        return "error" if status in RETRYABLE_STATUSES else "ok"
+
+    # Public API
+
+    async def send(self, request: Callable[[], Awaitable[httpx.Response]], tokens: int = 0) -> httpx.Response:
+        """
+        Run `request` once admitted, retrying throttled or failed attempts.
+
+        Returns the last response, which may still be an error once retries run out.
+        """
+        call_priority = priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(tokens, call_priority)
+            response: Optional[httpx.Response] = None
+            outcome = "error"
+            try:
+                response = await request()
+                self._observe(response)
+                outcome = self._outcome(response.status_code)
+                if outcome == "ok" or attempt == self.max_retries:
+                    return response
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                self._release(outcome)
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._retry_delay(response, attempt))
+        raise AssertionError("unreachable")
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        open_stream: Callable[[], AsyncContextManager[httpx.Response]],
+        tokens: int = 0,
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        Like send() for streamed responses: the slot is held until the body has been read
+        """
+        call_priority = priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(tokens, call_priority)
+            response: Optional[httpx.Response] = None
+            outcome = "error"
+            async with AsyncExitStack() as stack:
+                stack.callback(lambda: self._release(outcome))
+                try:
+                    response = await stack.enter_async_context(open_stream())
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                if response is not None:
+                    self._observe(response)
+                    outcome = self._outcome(response.status_code)
+                    if outcome == "ok" or attempt == self.max_retries:
+                        yield response
+                        return
+                    await response.aread()
+            self.stats["retries"] += 1
+            await asyncio.sleep(self._retry_delay(response, attempt))
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        waits = sorted(self._waits)
+
+        def wait_percentile(pct: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(pct / 100 * len(waits)))]
+
+        depth: Dict[int, int] = {}
+        for waiter in self._queue:
+            if not waiter.future.done():
+                depth[waiter.priority] = depth.get(waiter.priority, 0) + 1
+
+        return {
+            "queue_depth": sum(depth.values()),
+            "queue_depth_by_priority": depth,
+            "in_flight": self.in_flight,
+            "concurrency_limit": round(self.limit, 2),
+            "paused_for_seconds": round(max(0.0, self._paused_until - now), 2),
+            "remaining_requests": self.requests.remaining,
+            "remaining_tokens": self.tokens.remaining,
+            "tokens_reset_in_seconds": round(max(0.0, self.tokens.reset_at - now), 2),
+            "queue_wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            "queue_wait_p95_ms": round(wait_percentile(95) * 1000, 1),
+            "queue_wait_max_ms": round(waits[-1] * 1000, 1) if waits else 0.0,
+            **self.stats,
+        }
+
+
+class UpstreamBusy(Exception):
+    """
+    A call waited longer than the queue timeout for an upstream slot
+    """
+
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"{name} is at capacity; no slot within {timeout:.0f}s")
+        self.retry_after = timeout
+
+
+def _optional_int(name: str) -> Optional[int]:
+    value = os.getenv(name, "")
+    return int(value) if value else None
+
+
+# Scheduler for Groq chat completions; budgets are learned from Groq's x-ratelimit-* headers
+groq = UpstreamScheduler(
+    "groq",
+    initial_concurrency=float(os.getenv("GROQ_INITIAL_CONCURRENCY", "4")),
+    max_concurrency=float(os.getenv("GROQ_MAX_CONCURRENCY", "32")),
+    max_retries=int(os.getenv("GROQ_MAX_RETRIES", "4")),
+    queue_timeout=float(os.getenv("GROQ_QUEUE_TIMEOUT", "60")),
+    requests_per_window=_optional_int("GROQ_REQUESTS_PER_MINUTE"),
+    tokens_per_window=_optional_int("GROQ_TOKENS_PER_MINUTE"),
+)
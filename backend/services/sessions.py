@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Literal, Optional, Tuple
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# SQLite file holding session data; shared by every worker process on the host
+SESSION_DB = os.getenv("SESSION_DB", ".cache/sessions.sqlite3")
+
+# Sessions kept in memory per process
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+# Parsed Credentials objects kept per process
+CREDENTIALS_CACHE_SIZE = int(os.getenv("CREDENTIALS_CACHE_SIZE", "1000"))
+
+
+class SessionStore:
+    """
+    Session data by id: an in-memory LRU in front of a SQLite table.
+
+    Every write bumps the session's version. Reads check only the version in SQLite
+    and reuse the in-memory copy while it is current, so a change made by another
+    worker (e.g. refreshed tokens) is seen on the next request.
+    """
+
+    def __init__(self, path: str = SESSION_DB, max_entries: int = SESSION_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        # id -> (version, expires_at, data)
+        self._entries: "OrderedDict[str, Tuple[int, float, Dict[str, Any]]]" = OrderedDict()
+        self.stats = {"memory_hits": 0, "store_loads": 0, "writes": 0, "deletes": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions "
+                    "(id TEXT PRIMARY KEY, data TEXT NOT NULL, version INTEGER NOT NULL, expires_at REAL NOT NULL)"
+                )
+            self._conn = conn
+        return self._conn
+
+    def _remember(self, session_id: str, version: int, expires_at: float, data: Dict[str, Any]):
+        self._entries[session_id] = (version, expires_at, data)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """
+        Session data and its expiry time, or None if missing or expired
+        """
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT version, expires_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or row[1] <= time.time():
+                self._entries.pop(session_id, None)
+                return None
+
+            version, expires_at = row
+            cached = self._entries.get(session_id)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(session_id)
+                self.stats["memory_hits"] += 1
+                return dict(cached[2]), expires_at
+
+            row = db.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            self._remember(session_id, version, expires_at, data)
+            self.stats["store_loads"] += 1
+            return dict(data), expires_at
+
+    def set(self, session_id: str, data: Dict[str, Any], ttl: float):
+        expires_at = time.time() + ttl
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute(
+                    "INSERT INTO sessions (id, data, version, expires_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, version = version + 1, "
+                    "expires_at = excluded.expires_at",
+                    (session_id, json.dumps(data), expires_at),
+                )
+            version = db.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            self._remember(session_id, version, expires_at, dict(data))
+            self.stats["writes"] += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._entries.pop(session_id, None)
+            self.stats["deletes"] += 1
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            db = self._db()
+            with db:
+                return db.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    async def aget(self, session_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aset(self, session_id: str, data: Dict[str, Any], ttl: float):
+        await asyncio.to_thread(self.set, session_id, data, ttl)
+
+    async def adelete(self, session_id: str):
+        await asyncio.to_thread(self.delete, session_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"sessions_cached": len(self._entries), **self.stats}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement for Starlette's SessionMiddleware that keeps session data on
+    the server. The cookie carries only a signed, random session id; `request.session`
+    works as before.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        secret_key: str,
+        store: Optional[SessionStore] = None,
+        session_cookie: str = "session",
+        max_age: int = 14 * 24 * 60 * 60,  # 14 days, in seconds
+        path: str = "/",
+        same_site: Literal["lax", "strict", "none"] = "lax",
+        https_only: bool = False,
+    ) -> None:
+        self.app = app
+        self.signer = itsdangerous.Signer(str(secret_key))
+        self.store = store or SessionStore()
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.path = path
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:  # Secure flag can be used with HTTPS only
+            self.security_flags += "; secure"
+        self._purged_at = 0.0
+
+    def _session_id(self, connection: HTTPConnection) -> Optional[str]:
+        cookie = connection.cookies.get(self.session_cookie)
+        if not cookie:
+            return None
+        try:
+            return self.signer.unsign(cookie.encode("utf-8")).decode("utf-8")
+        except BadSignature:
+            # Forged ids, and cookies from before sessions moved server-side
+            return None
+
+    def _cookie(self, value: str, expires: str) -> str:
+        return f"{self.session_cookie}={value}; path={self.path}; {expires}{self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):  # pragma: no cover
+            await self.app(scope, receive, send)
+            return
+
+        session_id = self._session_id(HTTPConnection(scope))
+        loaded = await self.store.aget(session_id) if session_id else None
+        if loaded is None:
+            session_id, initial, expires_at = None, {}, 0.0
+        else:
+            initial, expires_at = loaded
+        scope["session"] = dict(initial)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                headers = MutableHeaders(scope=message)
+                if session:
+                    # Write only when the data changed or half the lifetime has passed
+                    if session_id is None or session != initial or expires_at - time.time() < self.max_age / 2:
+                        if session_id is None:
+                            session_id = secrets.token_urlsafe(32)
+                        await self.store.aset(session_id, session, self.max_age)
+                    signed = self.signer.sign(session_id.encode("utf-8")).decode("utf-8")
+                    headers.append("Set-Cookie", self._cookie(signed, f"Max-Age={self.max_age}; "))
+                elif session_id is not None:
+                    # The session has been cleared
+                    await self.store.adelete(session_id)
+                    headers.append("Set-Cookie", self._cookie("null", "expires=Thu, 01 Jan 1970 00:00:00 GMT; "))
+            await send(message)
+
+        if time.time() - self._purged_at > 3600:
+            self._purged_at = time.time()
+            await asyncio.to_thread(self.store.purge_expired)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class CredentialsCache:
+    """
+    Parsed google Credentials by their JSON, so routes don't re-parse on every request
+    """
+
+    def __init__(self, max_entries: int = CREDENTIALS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, credentials_json: str) -> Any:
+        key = hashlib.sha256(credentials_json.encode()).hexdigest()
+        credentials = self._entries.get(key)
+        if credentials is not None:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return credentials
+
+        from google.oauth2.credentials import Credentials
+
+        self.stats["misses"] += 1
+        credentials = Credentials.from_authorized_user_info(json.loads(credentials_json))
+        self.put(credentials_json, credentials)
+        return credentials
+
+    def put(self, credentials_json: str, credentials: Any):
+        self._entries[hashlib.sha256(credentials_json.encode()).hexdigest()] = credentials
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"credentials_cached": len(self._entries), **self.stats}
+
+
+# Process-wide session store and credentials cache
+store = SessionStore()
+credentials_cache = CredentialsCache()
+
+
+def session_credentials(session: Dict[str, Any]) -> Optional[Any]:
+    """
+    Credentials stored in a session, parsed at most once per process
+    """
+    credentials_json = session.get("credentials")
+    if not credentials_json:
+        return None
+    return credentials_cache.get(credentials_json)
+
+
+def store_credentials(session: Dict[str, Any], credentials: Any):
+    """
+    Save (e.g. refreshed) credentials in the session and keep the parsed object cached
+    """
+    credentials_json = credentials.to_json()
+    session["credentials"] = credentials_json
+    credentials_cache.put(credentials_json, credentials)
@@ -0,0 +1,79 @@
+import asyncio
+import importlib
+import os
+import time
+from typing import List, Optional
+
+# When the heavy modules that routes import on first use get loaded:
+#   prewarm - in a background thread, while the server already accepts requests
+#   eager   - during startup, before the first request is accepted
+#   lazy    - only when a request first needs one
+STARTUP_MODE = os.getenv("STARTUP_MODE", "prewarm")
+
+# Modules deferred until first use, in roughly the order requests need them. Our own
+# modules here are the ones that pull in NumPy; the Google client libraries are only
+# used by the email and auth routes. Routes import these inside the functions that use
+# them, never at module level, so `import main` doesn't pay for them; a module added
+# here must be imported the same way.
+DEFERRED_MODULES = [
+    "numpy",
+    "services.dedup",
+    "services.passage_index",
+    "google.oauth2.credentials",
+    "googleapiclient.errors",
+    "google_auth_oauthlib.flow",
+    "googleapiclient.discovery",
+    "google_auth_httplib2",
+]
+
+# Parser each extraction backend loads, imported here so the extraction processes forked
+# from this one start with it
+EXTRACT_BACKEND_MODULES = {"lxml": "lxml.html", "bs4": "bs4"}
+
+# Import time in ms of each deferred module; a module a request already loaded shows about 0
+stats = {"mode": STARTUP_MODE, "done": False, "elapsed_ms": 0.0, "modules": {}, "errors": {}}
+
+_task: Optional[asyncio.Task] = None
+
+
+def deferred_modules() -> List[str]:
+    """
+    The deferred modules, plus the parser of the configured extraction backend
+    """
+    from services import extract
+
+    backend = EXTRACT_BACKEND_MODULES.get(extract.DEFAULT_BACKEND)
+    return DEFERRED_MODULES + ([backend] if backend else [])
+
+
+def preload(modules: Optional[List[str]] = None):
+    """
+    Import modules now (by default the deferred ones), timing each; safe on any thread,
+    as imports of the same module from a request wait for this one to finish
+    """
+    started = time.perf_counter()
+    for name in modules or deferred_modules():
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            # A missing optional library only fails the requests that need it
+            stats["errors"][name] = str(e)
+            continue
+        stats["modules"][name] = round((time.perf_counter() - start) * 1000, 2)
+    stats["elapsed_ms"] = round(stats["elapsed_ms"] + (time.perf_counter() - started) * 1000, 2)
+    stats["done"] = True
+
+
+async def start():
+    """
+    Load the deferred modules as STARTUP_MODE says; called from the app's lifespan startup
+    """
+    global _task
+    if STARTUP_MODE == "eager":
+        await asyncio.to_thread(preload)
+    elif STARTUP_MODE == "prewarm":
+        # Runs once startup returns and the server begins accepting connections
+        _task = asyncio.create_task(asyncio.to_thread(preload))
+    else:
+        stats["done"] = True
@@ -0,0 +1,102 @@
+import importlib.util
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from fastapi import Request
+
+# HTTP/2 needs the optional h2 package (httpx[http2]); fall back to HTTP/1.1 without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class UpstreamConfig:
+    name: str
+    base_url: str = ""
+    timeout: float = 30.0
+    connect_timeout: float = 5.0
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 60.0
+    http2: bool = True
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        """
+        Build a config whose fields can be overridden by <NAME>_<FIELD> environment variables
+        """
+        config = cls(name=name, **defaults)
+        prefix = name.upper()
+        for field_name, cast in (
+            ("base_url", str),
+            ("timeout", float),
+            ("connect_timeout", float),
+            ("max_connections", int),
+            ("max_keepalive_connections", int),
+            ("keepalive_expiry", float),
+        ):
+            value = os.getenv(f"{prefix}_{field_name.upper()}")
+            if value:
+                setattr(config, field_name, cast(value))
+        http2 = os.getenv(f"{prefix}_HTTP2")
+        if http2:
+            config.http2 = http2.lower() in ("1", "true", "yes")
+        return config
+
+    def client_kwargs(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "http2": self.http2 and HTTP2_AVAILABLE,
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        }
+
+    def create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(**self.client_kwargs())
+
+
+def default_configs() -> List[UpstreamConfig]:
+    """
+    The upstreams the API talks to, configurable through the environment
+    """
+    return [
+        UpstreamConfig.from_env("google_search", base_url="https://www.googleapis.com", timeout=10.0),
+        UpstreamConfig.from_env("groq", base_url="https://api.groq.com/openai/v1", timeout=60.0),
+        # Arbitrary websites for scraping; many hosts, so keep fewer idle connections each
+        UpstreamConfig.from_env("web", timeout=10.0, max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0),
+    ]
+
+
+class UpstreamRegistry:
+    """
+    One pooled, keep-alive HTTP client per upstream, shared by every request
+    """
+
+    def __init__(self, configs: Optional[List[UpstreamConfig]] = None):
+        self.configs = {config.name: config for config in (configs or default_configs())}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        if name not in self._clients:
+            self._clients[name] = self.configs[name].create_client()
+        return self._clients[name]
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+def upstream_client(name: str) -> Callable[[Request], httpx.AsyncClient]:
+    """
+    FastAPI dependency returning the shared client for an upstream
+    """
+    def dependency(request: Request) -> httpx.AsyncClient:
+        return request.app.state.upstreams.get(name)
+
+    return dependency
@@ -18,23 +18,72 @@ const MainContent = () => {
   const [isLoading, setIsLoading] = useState(false);
   const [responseContent, setResponseContent] = useState('');
   const [error, setError] = useState('');
+  const [progress, setProgress] = useState('');
 
   const handlePromptSubmit = async (prompt, content) => {
     setIsLoading(true);
     setError('');
+    setResponseContent('');
+    setProgress('Searching the web...');
     
     try {
-      const response = await api.post('/api/groq', {
-        prompt,
-        content
+      // The server searches, scrapes and generates in one request and streams its progress;
+      // text shows up as soon as the first tokens arrive
+      const response = await fetch(`${api.defaults.baseURL}/api/research`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ query: prompt })
       });
       
-      setResponseContent(response.data.output);
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'An error occurred while processing your request');
+      }
+      
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let output = '';
+      let linkCount = 0;
+      let pagesDone = 0;
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Server-Sent Events are separated by a blank line
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const rawEvent of events) {
+          const lines = rawEvent.split('\n');
+          const event = lines.find((line) => line.startsWith('event:'))?.slice(6).trim();
+          const data = JSON.parse(lines.find((line) => line.startsWith('data:'))?.slice(5) || '{}');
+          
+          if (event === 'links') {
+            linkCount = data.links.length;
+            setProgress(`Reading ${linkCount} sources...`);
+          } else if (event === 'page') {
+            pagesDone += 1;
+            setProgress(`Read ${pagesDone} of ${linkCount} sources...`);
+          } else if (event === 'generation') {
+            setProgress('Writing the answer...');
+          } else if (event === 'token') {
+            output += data.content;
+            setResponseContent(output);
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (err) {
-      setError(err.response?.data?.detail || 'An error occurred while processing your request');
+      setError(err.message || 'An error occurred while processing your request');
       console.error('Error processing prompt:', err);
     } finally {
       setIsLoading(false);
+      setProgress('');
     }
   };
 
@@ -52,6 +101,9 @@ const MainContent = () => {
         <section className="bg-white p-6 rounded-lg shadow-md">
           <h2 className="text-xl font-semibold mb-4">Research Query</h2>
           <PromptForm onSubmit={handlePromptSubmit} isLoading={isLoading} />
+          {progress && (
+            <p className="mt-3 text-sm text-gray-500">{progress}</p>
+          )}
         </section>
 
         {error && (